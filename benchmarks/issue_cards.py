@@ -0,0 +1,93 @@
+"""Measure how long it takes to create and draw issue cards.
+
+Rebuilds the same cards several times, like re-entering the issue screen,
+with and without the texture cache.
+
+    python benchmarks/issue_cards.py --cards 50 --rounds 5
+"""
+
+import argparse
+import os
+import pathlib
+import random
+import statistics
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+
+from dateutil.parser import isoparse
+from kivy.base import EventLoop
+from kivy.lang import Builder
+from kivy.uix.stacklayout import StackLayout
+
+from treadi import main as treadi_main
+from treadi.data import Issue
+from treadi.data import Repository
+
+WORDS = "fix add remove crash launch node topic param service action test docs"
+
+
+def make_issues(num_cards):
+    issues = []
+    for number in range(1, num_cards + 1):
+        issues.append(
+            Issue(
+                repo=Repository(owner="ros2", name=f"repo{number % 7}"),
+                author=f"user{number % 13}",
+                created_at=isoparse("2006-07-04T15:00:00Z"),
+                updated_at=isoparse("2006-07-04T16:00:00Z"),
+                number=number,
+                title=" ".join(random.choices(WORDS.split(), k=8)),
+                url=f"https://github.com/ros2/repo/issues/{number}",
+            )
+        )
+    return issues
+
+
+def build_cards(window, issues):
+    """Return seconds to create the cards and draw one frame of them."""
+    layout = StackLayout(orientation="tb-lr")
+    window.add_widget(layout)
+    start = time.perf_counter()
+    for issue in issues:
+        card = treadi_main.IssueWidget(issue)
+        card.size_hint_y = None
+        card.height = 100
+        layout.add_widget(card)
+    # Lay out the cards and render their labels
+    EventLoop.idle()
+    elapsed = time.perf_counter() - start
+    window.remove_widget(layout)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    Builder.load_file(str(pathlib.Path(treadi_main.__file__).parent / "treadi.kv"))
+    EventLoop.ensure_window()
+    window = EventLoop.window
+    issues = make_issues(args.cards)
+
+    textures = treadi_main.TEXTURES
+    for capacity in (0, textures.capacity):
+        textures.capacity = capacity
+        textures.clear()
+        textures.hits = textures.misses = 0
+        times = [build_cards(window, issues) for _ in range(args.rounds)]
+        first = 1000 * times[0] / args.cards
+        later = 1000 * statistics.median(times[1:] or times) / args.cards
+        lookups = max(textures.hits + textures.misses, 1)
+        print(
+            f"texture cache size {capacity}: "
+            f"first round {first:.3f} ms/card, "
+            f"later rounds {later:.3f} ms/card (median), "
+            f"hit rate {textures.hits / lookups:.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
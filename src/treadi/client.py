@@ -0,0 +1,31 @@
+import pathlib
+
+from gql import Client
+from gql.transport.requests import RequestsHTTPTransport
+from graphql import build_ast_schema
+from graphql import parse
+
+
+SCHEMA_PATH = pathlib.Path(__file__).parent.resolve() / "schema.docs.graphql"
+
+
+def load_schema():
+    """Read and parse Github's GraphQL schema.
+
+    This is slow, so it's worth doing once and sharing the result.
+    """
+    return build_ast_schema(parse(SCHEMA_PATH.read_text()))
+
+
+def make_gql_client(access_token, schema=None):
+    transport = RequestsHTTPTransport(
+        url="https://api.github.com/graphql",
+        headers={
+            "Authorization": f"bearer {access_token}",
+        },
+        verify=True,
+        retries=3,
+    )
+    if schema is None:
+        schema = load_schema()
+    return Client(transport=transport, schema=schema)
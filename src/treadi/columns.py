@@ -0,0 +1,186 @@
+"""Column oriented storage of issues for ranking them with NumPy.
+
+NumPy is optional, install it with the `ranking` extra.
+"""
+
+import time
+
+import numpy as np
+
+from .data import issue_key
+
+
+class Columns:
+    """Views of a ColumnStore's arrays, one element per row.
+
+    Rows that don't hold an issue have `alive` set to False.
+    """
+
+    def __init__(self, store):
+        size = store._size
+        self.updated_at = store._updated_at[:size]
+        self.created_at = store._created_at[:size]
+        self.repo_id = store._repo_id[:size]
+        self.author_id = store._author_id[:size]
+        self.is_pr = store._is_pr[:size]
+        self.is_read = store._is_read[:size]
+        self.alive = store._alive[:size]
+        # Id -> Repository, and id -> author login
+        self.repos = store._repos
+        self.authors = store._authors
+
+    def repo_values(self, mapping, default=0.0):
+        """Return an array of `mapping[repo]` for the repo of every row."""
+        values = np.array(
+            [mapping.get(r, default) for r in self.repos] or [default], dtype=float
+        )
+        return values[self.repo_id]
+
+    def author_values(self, mapping, default=0.0):
+        """Return an array of `mapping[author]` for the author of every row."""
+        values = np.array(
+            [mapping.get(a, default) for a in self.authors] or [default], dtype=float
+        )
+        return values[self.author_id]
+
+
+class ColumnStore:
+    """Issues stored as parallel NumPy arrays.
+
+    Removed rows are reused by later additions, so the arrays only grow
+    when there are more issues than ever before.
+    """
+
+    def __init__(self, capacity=1024):
+        self._size = 0
+        self._updated_at = np.zeros(capacity, dtype=np.float64)
+        self._created_at = np.zeros(capacity, dtype=np.float64)
+        self._repo_id = np.zeros(capacity, dtype=np.int32)
+        self._author_id = np.zeros(capacity, dtype=np.int32)
+        self._is_pr = np.zeros(capacity, dtype=bool)
+        self._is_read = np.zeros(capacity, dtype=bool)
+        self._alive = np.zeros(capacity, dtype=bool)
+        # Issue key -> row, and row -> Issue
+        self._rows = {}
+        self._issues = [None] * capacity
+        self._free_rows = []
+        self._repos = []
+        self._repo_ids = {}
+        self._authors = []
+        self._author_ids = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _grow(self):
+        capacity = 2 * len(self._alive)
+        for name in (
+            "_updated_at",
+            "_created_at",
+            "_repo_id",
+            "_author_id",
+            "_is_pr",
+            "_is_read",
+            "_alive",
+        ):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[: len(old)] = old
+            setattr(self, name, new)
+        self._issues.extend([None] * (capacity - len(self._issues)))
+
+    @staticmethod
+    def _intern(value, values, ids):
+        i = ids.get(value)
+        if i is None:
+            i = ids[value] = len(values)
+            values.append(value)
+        return i
+
+    def add(self, issue):
+        key = issue_key(issue)
+        row = self._rows.get(key)
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+            else:
+                if self._size == len(self._alive):
+                    self._grow()
+                row = self._size
+                self._size += 1
+            self._rows[key] = row
+        self._issues[row] = issue
+        self._updated_at[row] = issue.updated_at.timestamp()
+        self._created_at[row] = issue.created_at.timestamp()
+        self._repo_id[row] = self._intern(issue.repo, self._repos, self._repo_ids)
+        self._author_id[row] = self._intern(
+            issue.author, self._authors, self._author_ids
+        )
+        self._is_pr[row] = issue.is_pr
+        self._is_read[row] = issue.is_read
+        self._alive[row] = True
+
+    def remove(self, issue):
+        row = self._rows.pop(issue_key(issue), None)
+        if row is None:
+            return
+        self._issues[row] = None
+        self._alive[row] = False
+        self._free_rows.append(row)
+
+    def top(self, n, score):
+        """Return the n issues with the highest scores, highest first.
+
+        `score(columns)` must return an array with a score for every row.
+        """
+        n = min(n, len(self._rows))
+        if n <= 0:
+            return []
+        columns = Columns(self)
+        scores = np.asarray(score(columns), dtype=np.float64)
+        scores = np.where(columns.alive, -scores, np.inf)
+        # Only sort the n best rows
+        if n < len(scores):
+            rows = np.argpartition(scores, n - 1)[:n]
+        else:
+            rows = np.arange(len(scores))
+        rows = rows[np.argsort(scores[rows], kind="stable")]
+        return [self._issues[r] for r in rows]
+
+
+class WeightedScore:
+    """Scores issues by recency, with bonuses for what matters more.
+
+    Weights are in units of `time_scale` seconds, so a weight of 1 ranks an
+    issue like one updated `time_scale` seconds more recently. Age counts
+    linearly, so the order of issues doesn't change as time passes.
+    """
+
+    def __init__(
+        self,
+        *,
+        time_scale=24 * 60 * 60,
+        repo_weights=None,
+        author_weights=None,
+        pr_weight=0.0,
+        unread_weight=0.0,
+        now=time.time,
+    ):
+        self.time_scale = time_scale
+        self.repo_weights = repo_weights or {}
+        self.author_weights = author_weights or {}
+        self.pr_weight = pr_weight
+        self.unread_weight = unread_weight
+        self._now = now
+
+    def __call__(self, columns):
+        score = (columns.updated_at - self._now()) / self.time_scale
+        if self.repo_weights:
+            score += columns.repo_values(self.repo_weights)
+        if self.author_weights:
+            score += columns.author_values(self.author_weights)
+        if self.pr_weight:
+            score += self.pr_weight * columns.is_pr
+        if self.unread_weight:
+            score += self.unread_weight * ~columns.is_read
+        return score
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from datetime import datetime
+from datetime import timezone
 
 
 @dataclass(frozen=True)
@@ -19,7 +20,106 @@ class Issue:
     url: str = ""
     # Has the current viewer looked at this issue or PR?
     is_read: bool = False
+    # Is this a pull request instead of an issue?
+    is_pr: bool = False
+    # Has this issue been closed, or this PR closed or merged?
+    is_closed: bool = False
+    # Github's GraphQL ID, for refreshing this issue with a `nodes` query
+    node_id: str = ""
 
 
 def is_same_issue(l, r):
     return l.repo == r.repo and l.number == r.number
+
+
+def issue_key(issue):
+    """Return a hashable key that is the same for all versions of an issue."""
+    return (issue.repo.owner, issue.repo.name, issue.number)
+
+
+def issue_to_dict(issue):
+    """Convert an issue to a JSON serializable dict."""
+    return {
+        "owner": issue.repo.owner,
+        "name": issue.repo.name,
+        "number": issue.number,
+        "author": issue.author,
+        "created_at": issue.created_at.isoformat() if issue.created_at else None,
+        "updated_at": issue.updated_at.isoformat() if issue.updated_at else None,
+        "title": issue.title,
+        "url": issue.url,
+        "is_read": issue.is_read,
+        "is_pr": issue.is_pr,
+        "is_closed": issue.is_closed,
+        "node_id": issue.node_id,
+    }
+
+
+def issue_from_dict(d):
+    """Inverse of `issue_to_dict`."""
+    return Issue(
+        repo=Repository(owner=d["owner"], name=d["name"]),
+        author=d.get("author", ""),
+        created_at=(
+            datetime.fromisoformat(d["created_at"]) if d.get("created_at") else None
+        ),
+        updated_at=(
+            datetime.fromisoformat(d["updated_at"]) if d.get("updated_at") else None
+        ),
+        number=int(d["number"]),
+        title=d.get("title", ""),
+        url=d.get("url", ""),
+        is_read=bool(d.get("is_read", False)),
+        is_pr=bool(d.get("is_pr", False)),
+        is_closed=bool(d.get("is_closed", False)),
+        node_id=d.get("node_id", ""),
+    )
+
+
+def issue_to_record(issue):
+    """Convert an issue to a compact tuple for sending to another process."""
+    return (
+        issue.repo.owner,
+        issue.repo.name,
+        issue.number,
+        issue.author,
+        issue.created_at.timestamp(),
+        issue.updated_at.timestamp(),
+        issue.title,
+        issue.url,
+        issue.is_read,
+        issue.is_pr,
+        issue.is_closed,
+        issue.node_id,
+    )
+
+
+def issue_from_record(record):
+    """Inverse of `issue_to_record`."""
+    (
+        owner,
+        name,
+        number,
+        author,
+        created,
+        updated,
+        title,
+        url,
+        is_read,
+        is_pr,
+        is_closed,
+        node_id,
+    ) = record
+    return Issue(
+        repo=Repository(owner=owner, name=name),
+        author=author,
+        created_at=datetime.fromtimestamp(created, timezone.utc),
+        updated_at=datetime.fromtimestamp(updated, timezone.utc),
+        number=number,
+        title=title,
+        url=url,
+        is_read=is_read,
+        is_pr=is_pr,
+        is_closed=is_closed,
+        node_id=node_id,
+    )
@@ -0,0 +1,134 @@
+"""Frame times of the UI main loop, and what made frames long.
+
+FrameTimer keeps a histogram of how long frames take for every mix of
+background work that was going on during them, so stutter can be blamed
+on the loader work it happened alongside. Frames that take longer than
+`long_frame` are kept with the sections that ran on the UI thread during
+them.
+
+Both kinds of work are the sections labeled with `profiling.section()`.
+"""
+
+import bisect
+import threading
+import time
+from collections import Counter
+from collections import defaultdict
+from collections import deque
+from collections import namedtuple
+
+from . import profiling
+
+
+# Upper bounds in seconds of the histogram buckets, with one more bucket
+# for anything longer
+BUCKETS = (1 / 60, 2 / 60, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# `ran` maps labels of sections on the UI thread to seconds spent in them,
+# and `background` is a sorted tuple of labels that other threads were in
+LongFrame = namedtuple("LongFrame", ("start", "duration", "ran", "background"))
+
+
+class FrameTimer:
+
+    def __init__(self, long_frame=0.05, max_long_frames=100, clock=time.perf_counter):
+        self.long_frame = long_frame
+        # Background labels -> number of frames in each bucket
+        self.histograms = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self.long_frames = deque(maxlen=max_long_frames)
+        self._clock = clock
+        # Must be created on the UI thread, the one that calls tick()
+        self._ui_thread = threading.get_ident()
+        self._frame_start = None
+        # Only touched by the UI thread
+        self._ran = defaultdict(float)
+        self._lock = threading.Lock()
+        # Label -> number of background threads in that section now
+        self._active = Counter()
+        # Labels background threads were in at any time this frame
+        self._background = set()
+
+    def enter(self, label):
+        if threading.get_ident() == self._ui_thread:
+            return
+        with self._lock:
+            self._active[label] += 1
+            self._background.add(label)
+
+    def exit(self, label, seconds):
+        if threading.get_ident() == self._ui_thread:
+            self._ran[label] += seconds
+            return
+        with self._lock:
+            self._active[label] -= 1
+            if not self._active[label]:
+                del self._active[label]
+
+    def tick(self):
+        """End the current frame and start the next one.
+
+        Call this once per frame from the UI thread. Returns a LongFrame
+        if the frame that ended was long, otherwise None.
+        """
+        now = self._clock()
+        with self._lock:
+            background = tuple(sorted(self._background))
+            # Sections still running carry on into the next frame
+            self._background = set(self._active)
+        ran = self._ran
+        self._ran = defaultdict(float)
+        start = self._frame_start
+        self._frame_start = now
+        if start is None:
+            return None
+        duration = now - start
+        self.histograms[background][bisect.bisect_left(BUCKETS, duration)] += 1
+        if duration <= self.long_frame:
+            return None
+        frame = LongFrame(start, duration, dict(ran), background)
+        self.long_frames.append(frame)
+        return frame
+
+    def summary(self):
+        """Return the histograms as a table of frame counts."""
+        names = [f"<{b * 1000:.0f}ms" for b in BUCKETS] + ["more"]
+        rows = [("background",) + tuple(names)]
+        for background, counts in sorted(self.histograms.items()):
+            name = ", ".join(background) or "idle"
+            rows.append((name,) + tuple(map(str, counts)))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return "\n".join(
+            row[0].ljust(widths[0])
+            + "".join(c.rjust(w + 2) for c, w in zip(row[1:], widths[1:]))
+            for row in rows
+        )
+
+
+def describe(frame):
+    ran = ", ".join(
+        f"{label} {seconds * 1000:.0f}ms"
+        for label, seconds in sorted(frame.ran.items(), key=lambda item: -item[1])
+    )
+    return (
+        f"Long frame of {frame.duration * 1000:.0f}ms"
+        f", ran: {ran or 'nothing labeled'}"
+        f", during: {', '.join(frame.background) or 'no background work'}"
+    )
+
+
+def start(long_frame=0.05):
+    """Start timing the frames of the running Kivy app."""
+    from kivy.clock import Clock
+    from kivy.logger import Logger
+
+    timer = FrameTimer(long_frame)
+    profiling.observe(timer)
+
+    def _tick(dt):
+        frame = timer.tick()
+        if frame is not None:
+            Logger.info(f"FrameTimer: {describe(frame)}")
+
+    # Interval 0 runs every frame
+    Clock.schedule_interval(_tick, 0)
+    return timer
@@ -0,0 +1,310 @@
+"""Run TreadI's loaders without a GUI.
+
+The ordered issue feed is written to stdout as JSON lines, and commands are
+read from stdin as JSON lines. The feed is the most recently updated issues,
+or the highest ranked ones if any of the ranking options are given.
+
+Output events:
+    {"event": "progress", "progress": 0.5}
+    {"event": "feed", "issues": [{...}, ...]}
+    {"event": "search", "query": "fix", "issues": [{...}, ...]}
+
+Input commands:
+    {"op": "feed"}
+    {"op": "search", "query": "fix"}
+    {"op": "dismiss", "owner": "ros2", "name": "rclpy", "number": 1234}
+"""
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+
+from . import auth
+from . import profiling
+from .client import make_gql_client
+from .data import Issue
+from .data import Repository
+from .data import issue_to_dict
+from .issue_cache import IssueCache
+from .issue_loader import IssueLoader
+from .notifications import NotificationPoller
+from .notifications import token_from_environment
+from .repo_loader import PRESETS
+from .repo_loader import make_repo_loader
+from .sync_daemon import SyncClient
+
+
+def login():
+    """Get an access token, falling back to the device flow on the terminal."""
+    token_response = auth.cycle_cached_token()
+    if token_response.status == auth.Status.ACCESS_GRANTED:
+        return token_response.access_token
+
+    device_flow = auth.start_device_flow()
+    print(
+        f"Login to Github using code {device_flow.user_code} "
+        f"at {device_flow.verification_uri}",
+        file=sys.stderr,
+    )
+    while True:
+        time.sleep(device_flow.interval)
+        token_response = auth.ask_for_token(device_flow)
+        match token_response.status:
+            case auth.Status.AUTHORIZATION_PENDING:
+                continue
+            case auth.Status.ACCESS_GRANTED:
+                auth.store_refresh_token(token_response.refresh_token)
+                return token_response.access_token
+            case _:
+                raise RuntimeError(f"Login failed: {token_response}")
+
+
+def repo_loader_specs(args):
+    specs = []
+    if args.user:
+        specs.append(("user",))
+    for org in args.org:
+        specs.append(("org", org))
+    for path in args.file:
+        specs.append(("file", path))
+    for url in args.vcs:
+        specs.append(("vcs", url))
+    for preset in args.preset:
+        specs.extend(PRESETS[preset])
+    if not specs:
+        raise RuntimeError(
+            "No repos given. Use --user, --org, --file, --vcs or --preset"
+        )
+    return specs
+
+
+class FeedWriter:
+    """Writes JSON lines events to a stream."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def write(self, event):
+        with self._lock:
+            self._stream.write(json.dumps(event) + "\n")
+            self._stream.flush()
+
+    def progress(self, progress):
+        self.write({"event": "progress", "progress": progress})
+
+    def search(self, query, issues):
+        self.write(
+            {
+                "event": "search",
+                "query": query,
+                "issues": [issue_to_dict(i) for i in issues],
+            }
+        )
+
+    def feed(self, issues):
+        self.write({"event": "feed", "issues": [issue_to_dict(i) for i in issues]})
+
+
+def handle_command(line, cache, writer, num_issues, loader=None):
+    command = json.loads(line)
+    match command.get("op"):
+        case "feed":
+            writer.feed(cache.top_ranked(n=num_issues))
+        case "search":
+            query = command["query"]
+            writer.search(query, cache.search(query, n=num_issues))
+        case "dismiss":
+            issue = Issue(
+                repo=Repository(owner=command["owner"], name=command["name"]),
+                number=int(command["number"]),
+            )
+            cache.dismiss(issue)
+            if loader is not None:
+                loader.dismiss(issue)
+            writer.feed(cache.top_ranked(n=num_issues))
+        case _:
+            raise RuntimeError(f"Unknown command {command}")
+
+
+def read_commands(stream, cache, writer, num_issues, loader=None):
+    logger = logging.getLogger("headless")
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            handle_command(line, cache, writer, num_issues, loader)
+        except Exception:
+            logger.exception(f"Failed to handle command {line!r}")
+
+
+def watch_feed(cache, writer, num_issues, interval):
+    """Write the feed whenever the top issues change.
+
+    Changes are coalesced so a burst of inserts writes the feed at most
+    once per `interval` seconds.
+    """
+    changed = threading.Event()
+    cache.add_listener(lambda issues: changed.set())
+    last = None
+    while True:
+        issues = cache.top_ranked(n=num_issues)
+        if issues != last:
+            writer.feed(issues)
+            last = issues
+        changed.wait()
+        changed.clear()
+        time.sleep(interval)
+
+
+def make_ranking(args):
+    """Return a score function for the ranking options, or None if none given."""
+    if not (
+        args.favorite_repo
+        or args.favorite_author
+        or args.pr_weight
+        or args.unread_weight
+    ):
+        return None
+    from .columns import WeightedScore
+
+    repo_weights = {}
+    for full_name in args.favorite_repo:
+        owner, name = full_name.split("/")
+        repo_weights[Repository(owner=owner, name=name)] = args.favorite_weight
+    return WeightedScore(
+        time_scale=24 * 60 * 60,
+        repo_weights=repo_weights,
+        author_weights={a: args.favorite_weight for a in args.favorite_author},
+        pr_weight=args.pr_weight,
+        unread_weight=args.unread_weight,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve TreadI's issue feed")
+    parser.add_argument("--user", action="store_true", help="Public repos I own")
+    parser.add_argument("--org", action="append", default=[], help="Organization")
+    parser.add_argument(
+        "--file", action="append", default=[], help="File with one owner/name per line"
+    )
+    parser.add_argument("--vcs", action="append", default=[], help="URL of .repos file")
+    parser.add_argument(
+        "--preset", action="append", default=[], choices=PRESETS, help="Preset repos"
+    )
+    parser.add_argument("-n", "--num-issues", type=int, default=5)
+    parser.add_argument(
+        "--max-issues",
+        type=int,
+        default=None,
+        help="Maximum number of not dismissed issues to keep in memory",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="Minimum seconds between feed updates",
+    )
+    parser.add_argument(
+        "--load-timeout",
+        type=float,
+        default=30 * 60,
+        help="Exit if loading issues takes longer than this many seconds",
+    )
+    ranking = parser.add_argument_group(
+        "ranking",
+        "Rank the feed instead of ordering it by update time. Weights are in "
+        "days, so a weight of 1 ranks an issue like one updated a day later. "
+        "Needs the ranking extra.",
+    )
+    ranking.add_argument(
+        "--favorite-repo",
+        metavar="OWNER/NAME",
+        action="append",
+        default=[],
+        help="Rank issues in this repo higher",
+    )
+    ranking.add_argument(
+        "--favorite-author",
+        metavar="LOGIN",
+        action="append",
+        default=[],
+        help="Rank issues by this author higher",
+    )
+    ranking.add_argument(
+        "--favorite-weight",
+        type=float,
+        default=1.0,
+        help="Weight of favorite repos and authors",
+    )
+    ranking.add_argument("--pr-weight", type=float, default=0.0)
+    ranking.add_argument("--unread-weight", type=float, default=0.0)
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        default=None,
+        help="Profile every thread, writing flame graph stacks to DIR on exit",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="Share loaders with other TreadI instances through the sync daemon",
+    )
+    args = parser.parse_args(argv)
+    if args.max_issues is not None and args.max_issues < 1:
+        parser.error("--max-issues must be at least 1")
+    try:
+        ranking = make_ranking(args)
+    except ImportError:
+        parser.error("Ranking needs NumPy, install TreadI's ranking extra")
+    except ValueError:
+        parser.error("--favorite-repo must be OWNER/NAME")
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    if args.profile:
+        profiling.start(args.profile)
+    else:
+        profiling.start_from_environment()
+
+    access_token = login()
+    specs = repo_loader_specs(args)
+
+    writer = FeedWriter(sys.stdout)
+    cache = IssueCache(max_upcomming=args.max_issues, ranking=ranking)
+    loaded = threading.Event()
+
+    def on_progress(progress):
+        writer.progress(progress)
+        if progress >= 1.0:
+            loaded.set()
+
+    if args.sync:
+        loader = SyncClient(access_token, specs, cache, on_progress)
+    else:
+        gql_client = make_gql_client(access_token)
+        repos = make_repo_loader(specs, gql_client).load_repos()
+        loader = IssueLoader(gql_client, repos, cache, on_progress)
+    loader.start()
+    if not loaded.wait(args.load_timeout):
+        logging.getLogger("headless").error(
+            f"Issues didn't finish loading within {args.load_timeout}s"
+        )
+        sys.exit(1)
+    notifications_token = token_from_environment()
+    if notifications_token:
+        NotificationPoller(notifications_token, cache).start()
+
+    threading.Thread(
+        target=read_commands,
+        args=(sys.stdin, cache, writer, args.num_issues, loader),
+        daemon=True,
+        name="Commands",
+    ).start()
+    watch_feed(cache, writer, args.num_issues, args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,313 @@
-from .data import is_same_issue
+import bisect
+import dataclasses
+import heapq
+import itertools
+from collections import Counter
+from collections import OrderedDict
+from collections import defaultdict
 from threading import Lock
 
+from . import profiling
+from .data import issue_key
+from .title_index import TitleIndex
 
-class IssueCache:
+
+class RecencyIndex:
+    """Keys of issues ordered from most to least recently updated.
+
+    Entries are kept in a list of short sorted lists, so adding or removing
+    an issue costs a binary search and a small list insertion, even with
+    100k issues.
+    """
+
+    # Split a sorted list once it grows beyond twice this size
+    LOAD = 500
 
     def __init__(self):
-        self.__upcomming = []
-        self.__dismissed = []
+        # Sorted lists of (-updated_at timestamp, issue key)
+        self._lists = []
+        # Last entry of each list in `_lists`
+        self._maxes = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for entries in self._lists:
+            for _, key in entries:
+                yield key
+
+    @staticmethod
+    def _entry(issue):
+        return (-issue.updated_at.timestamp(), issue_key(issue))
+
+    def add(self, issue):
+        entry = self._entry(issue)
+        self._len += 1
+        if not self._lists:
+            self._lists.append([entry])
+            self._maxes.append(entry)
+            return
+        i = bisect.bisect_left(self._maxes, entry)
+        if i == len(self._maxes):
+            i -= 1
+        entries = self._lists[i]
+        bisect.insort(entries, entry)
+        self._maxes[i] = entries[-1]
+        if len(entries) > 2 * self.LOAD:
+            self._lists.insert(i + 1, entries[self.LOAD :])
+            del entries[self.LOAD :]
+            self._maxes.insert(i, entries[-1])
+
+    def remove(self, issue):
+        """Remove an issue with the same `updated_at` as when it was added."""
+        entry = self._entry(issue)
+        i = bisect.bisect_left(self._maxes, entry)
+        if i == len(self._maxes):
+            return
+        entries = self._lists[i]
+        j = bisect.bisect_left(entries, entry)
+        if j == len(entries) or entries[j] != entry:
+            return
+        del entries[j]
+        self._len -= 1
+        if entries:
+            self._maxes[i] = entries[-1]
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+
+    def top(self, n):
+        return list(itertools.islice(self, n))
+
+    def oldest(self):
+        """Return the key of the least recently updated issue."""
+        return self._lists[-1][-1][1]
+
+
+class IssueCache:
+
+    # Most evicted and closed issues to remember, oldest are forgotten first
+    MAX_TOMBSTONES = 50_000
+
+    def __init__(self, max_upcomming=None, ranking=None):
+        if max_upcomming is not None and max_upcomming < 1:
+            raise ValueError(f"max_upcomming must be at least 1, not {max_upcomming}")
+        # Issue key -> Issue
+        self.__upcomming = {}
+        self.__dismissed = {}
+        # If set, the least recently updated issues are evicted from the
+        # upcomming list to keep it at this size.
+        self.__max_upcomming = max_upcomming
+        # The newest evicted issues, up to `max_upcomming` of them, which
+        # come back when dismissals and closes make room
+        self.__overflow = {}
+        self.__overflow_recent = RecencyIndex()
+        # Issue key -> updated_at timestamp of issues evicted from the
+        # overflow, and of closed issues, so they aren't re-added by stale data
+        self.__tombstones = OrderedDict()
+        self.__newest_update_time = None
+        self.__newest_update_time_by_repo = {}
+        # Indexes over the upcomming issues
+        self.__recent = RecencyIndex()
+        self.__by_repo = defaultdict(RecencyIndex)
+        self.__by_author = defaultdict(RecencyIndex)
+        self.__by_kind = defaultdict(RecencyIndex)
+        self.__unread = RecencyIndex()
+        self.__titles = TitleIndex()
+        # If given a score function, upcomming issues are also stored in
+        # NumPy arrays so they can be ranked by it.
+        self.__ranking = ranking
+        self.__columns = None
+        if ranking is not None:
+            from .columns import ColumnStore
+
+            self.__columns = ColumnStore()
         self.__lock = Lock()
+        self.__listeners = []
+
+    def add_listener(self, callback):
+        """Call `callback(issues)` with issues that changed the upcomming list.
+
+        The callback is called from whatever thread changed the cache,
+        so it should return quickly.
+        """
+        with self.__lock:
+            self.__listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self.__lock:
+            self.__listeners.remove(callback)
+
+    def _notify(self, issues):
+        with self.__lock:
+            listeners = tuple(self.__listeners)
+        for listener in listeners:
+            listener(issues)
 
     def insert(self, issue):
         """Insert an issue into the cache.
 
         If the cache already has newer info for the issue,
         it will silently ignore this insertion.
+        Inserting a closed issue removes it from the cache.
         """
         with self.__lock:
-            self._insert(issue)
+            changed = [issue] if self._insert(issue) else []
+            changed.extend(self._readmit())
+        if changed:
+            self._notify(changed)
+
+    def insert_many(self, issues):
+        """Insert many issues at once, notifying listeners one time."""
+        with self.__lock:
+            changed = [i for i in issues if self._insert(i)]
+            changed.extend(self._readmit())
+        if changed:
+            self._notify(changed)
 
     def _insert(self, issue):
-        for di, d in enumerate(self.__dismissed):
-            if is_same_issue(issue, d):
-                if issue.updated_at <= d.updated_at:
-                    # Not new data, nothing to do here
-                    return
-                if not issue.is_read:
-                    # Put it into the incomming list
-                    del self.__dismissed[di]
-                    break
+        key = issue_key(issue)
+        if (
+            self.__newest_update_time is None
+            or issue.updated_at > self.__newest_update_time
+        ):
+            self.__newest_update_time = issue.updated_at
+        repo_newest = self.__newest_update_time_by_repo.get(issue.repo)
+        if repo_newest is None or issue.updated_at > repo_newest:
+            self.__newest_update_time_by_repo[issue.repo] = issue.updated_at
+        if issue.is_closed:
+            return self._remove_closed(key, issue)
+        d = self.__dismissed.get(key)
+        if d is not None:
+            if issue.updated_at <= d.updated_at:
+                # Not new data, nothing to do here
+                return False
+            if issue.is_read:
                 # Update the dismissed list
-                self.__dismissed[di] = issue
-                return
+                self.__dismissed[key] = issue
+                return False
+            # Put it into the incomming list
+            del self.__dismissed[key]
+        evicted = self.__overflow.get(key)
+        if evicted is not None:
+            if issue.updated_at <= evicted.updated_at:
+                # Not new data, it stays evicted
+                return False
+            self._remove_overflow(key)
+        tombstone = self.__tombstones.get(key)
+        if tombstone is not None:
+            if issue.updated_at.timestamp() <= tombstone:
+                # Not new data, it stays evicted or closed
+                return False
+            del self.__tombstones[key]
         # If we get here, the issue belongs in the
         # upcomming list
-        for ui, u in enumerate(self.__upcomming):
-            if is_same_issue(issue, u):
-                if issue.updated_at > u.updated_at:
-                    self.__upcomming[ui] = issue
-                    return
-                return
-        # If we get here, the issue is new to us
-        self.__upcomming.append(issue)
+        u = self.__upcomming.get(key)
+        if u is not None:
+            if issue.updated_at <= u.updated_at:
+                return False
+            self._index_remove(u)
+        # If we get here, the issue is new or newer than what we had
+        self.__upcomming[key] = issue
+        self._index_add(issue)
+        if (
+            self.__max_upcomming is not None
+            and len(self.__upcomming) > self.__max_upcomming
+        ):
+            return self._evict_oldest() != key
+        return True
+
+    def _remove_closed(self, key, issue):
+        known = False
+        for issues in (self.__upcomming, self.__dismissed, self.__overflow):
+            existing = issues.get(key)
+            if existing is not None:
+                if existing.updated_at >= issue.updated_at:
+                    # Already have data from after it was closed
+                    return False
+                known = True
+        timestamp = issue.updated_at.timestamp()
+        if key in self.__tombstones:
+            if self.__tombstones[key] > timestamp:
+                return False
+        elif not known:
+            # Never seen it open, so there's nothing to keep out
+            return False
+        # Leave a tombstone so stale data from before it was closed doesn't
+        # bring it back. Reopening it makes it newer than the tombstone.
+        self._add_tombstone(key, timestamp)
+        self.__dismissed.pop(key, None)
+        if key in self.__overflow:
+            self._remove_overflow(key)
+        u = self.__upcomming.pop(key, None)
+        if u is None:
+            return False
+        self._index_remove(u)
+        return True
+
+    def _evict_oldest(self):
+        key = self.__recent.oldest()
+        issue = self.__upcomming.pop(key)
+        self._index_remove(issue)
+        self.__overflow[key] = issue
+        self.__overflow_recent.add(issue)
+        if len(self.__overflow) > self.__max_upcomming:
+            oldest = self._remove_overflow(self.__overflow_recent.oldest())
+            self._add_tombstone(issue_key(oldest), oldest.updated_at.timestamp())
+        return key
+
+    def _remove_overflow(self, key):
+        issue = self.__overflow.pop(key)
+        self.__overflow_recent.remove(issue)
+        return issue
+
+    def _add_tombstone(self, key, timestamp):
+        self.__tombstones[key] = timestamp
+        self.__tombstones.move_to_end(key)
+        while len(self.__tombstones) > self.MAX_TOMBSTONES:
+            self.__tombstones.popitem(last=False)
+
+    def _readmit(self):
+        """Bring back the newest evicted issues while there's room."""
+        readmitted = []
+        while self.__overflow and len(self.__upcomming) < self.__max_upcomming:
+            issue = self._remove_overflow(next(iter(self.__overflow_recent)))
+            self.__upcomming[issue_key(issue)] = issue
+            self._index_add(issue)
+            readmitted.append(issue)
+        return readmitted
+
+    def _index_add(self, issue):
+        self.__recent.add(issue)
+        self.__by_repo[issue.repo].add(issue)
+        self.__by_author[issue.author].add(issue)
+        self.__by_kind[issue.is_pr].add(issue)
+        if not issue.is_read:
+            self.__unread.add(issue)
+        self.__titles.add(issue_key(issue), issue.title)
+        if self.__columns is not None:
+            self.__columns.add(issue)
+
+    def _index_remove(self, issue):
+        self.__recent.remove(issue)
+        self._remove_from(self.__by_repo, issue.repo, issue)
+        self._remove_from(self.__by_author, issue.author, issue)
+        self._remove_from(self.__by_kind, issue.is_pr, issue)
+        if not issue.is_read:
+            self.__unread.remove(issue)
+        self.__titles.remove(issue_key(issue))
+        if self.__columns is not None:
+            self.__columns.remove(issue)
+
+    @staticmethod
+    def _remove_from(indexes, value, issue):
+        index = indexes[value]
+        index.remove(issue)
+        if not index:
+            # Don't keep empty indexes for authors and repos that are gone
+            del indexes[value]
 
     def dismiss(self, issue):
         """
@@ -48,47 +315,213 @@ class IssueCache:
         comes up in `most_recent_not_dismissed`.
         """
         with self.__lock:
-            self._dismiss(issue)
+            dismissed = self._dismiss(issue)
+            if dismissed is None:
+                return
+            readmitted = self._readmit()
+        # Listeners get the cached issue, `issue` may only have its key
+        self._notify([dismissed] + readmitted)
 
     def _dismiss(self, issue):
-        for di, d in enumerate(self.__dismissed):
-            if is_same_issue(issue, d):
-                # already dismissed, nothing to do!
-                return
-        for ui, u in enumerate(self.__upcomming):
-            if is_same_issue(issue, u):
-                # Move from upcomming to dismiseed
-                del self.__upcomming[ui]
-                self.__dismissed.append(u)
-                return
+        key = issue_key(issue)
+        if key in self.__dismissed:
+            # already dismissed, nothing to do!
+            return None
+        u = self.__upcomming.pop(key, None)
+        if u is None:
+            return None
+        # Move from upcomming to dismiseed
+        self._index_remove(u)
+        self.__dismissed[key] = u
+        return u
+
+    def remove_repos(self, repos):
+        """Drop the upcomming issues of repos that are no longer loaded.
+
+        Dismissed issues are remembered in case the repos are loaded again.
+        """
+        with self.__lock:
+            removed = []
+            for repo in repos:
+                index = self.__by_repo.get(repo)
+                if index is not None:
+                    for key in list(index):
+                        issue = self.__upcomming.pop(key)
+                        self._index_remove(issue)
+                        removed.append(issue)
+                self.__newest_update_time_by_repo.pop(repo, None)
+            removed_repos = set(repos)
+            for key, issue in list(self.__overflow.items()):
+                if issue.repo in removed_repos:
+                    self._remove_overflow(key)
+            removed.extend(self._readmit())
+        if removed:
+            self._notify(removed)
+
+    def set_read_states(self, read_states):
+        """Set whether issues have been read in bulk.
 
-    def most_recent_issues(self, n=1):
+        `read_states` is a dict of issue key -> is_read.
+        Issues that aren't in the cache are ignored.
+        Returns the number of issues that changed.
+        """
+        with self.__lock:
+            changed, upcomming = self._set_read_states(read_states)
+        if upcomming:
+            self._notify(upcomming)
+        return changed
+
+    def _set_read_states(self, read_states):
+        changed = 0
+        upcomming = []
+        for key, is_read in read_states.items():
+            # Dismissed and evicted issues aren't indexed by read state
+            issues = self.__dismissed if key in self.__dismissed else self.__overflow
+            d = issues.get(key)
+            if d is not None:
+                if d.is_read != is_read:
+                    issues[key] = dataclasses.replace(d, is_read=is_read)
+                    changed += 1
+                continue
+            u = self.__upcomming.get(key)
+            if u is None or u.is_read == is_read:
+                continue
+            self._index_remove(u)
+            u = dataclasses.replace(u, is_read=is_read)
+            self.__upcomming[key] = u
+            self._index_add(u)
+            upcomming.append(u)
+            changed += 1
+        return changed, upcomming
+
+    def most_recent_issues(
+        self, n=1, *, repo=None, author=None, is_pr=None, unread=None
+    ):
         """
         Return the n most recently updated and not
         dismissed issues.
+
+        The optional arguments filter the issues to those in a repo,
+        by an author, of a kind (issue or PR), or that are unread.
+        """
+        # The UI calls this, so time how long loaders keep it waiting
+        with profiling.section("cache lock wait"):
+            self.__lock.acquire()
+        try:
+            return self._most_recent_issues(
+                n, repo=repo, author=author, is_pr=is_pr, unread=unread
+            )
+        finally:
+            self.__lock.release()
+
+    def top_ranked(self, n=1):
+        """Return the n not dismissed issues with the highest score.
+
+        Falls back to the most recently updated issues if the cache
+        wasn't given a `ranking` score function.
         """
         with self.__lock:
-            return self._most_recent_issues(n)
+            if self.__columns is None:
+                return self._most_recent_issues(n)
+            return self.__columns.top(n, self.__ranking)
+
+    def search(self, query, n=5):
+        """Return up to n upcomming issues with titles matching the query.
 
-    def newest_update_time(self):
+        Better matches come first, and issues that match equally well are
+        ordered most recently updated first.
+        """
         with self.__lock:
-            self._sort()
-            u = self.__upcomming[:1]
-            d = self.__dismissed[:1]
-        if not u and not d:
-            return None
-        if not u:
-            return d[0].updated_at
-        if not d:
-            return u[0].updated_at
-        if d[0].updated_at > u[0].updated_at:
-            return d[0].updated_at
-        return u[0].updated_at
-
-    def _most_recent_issues(self, n):
-        self._sort()
-        return self.__upcomming[:n]
-
-    def _sort(self):
-        self.__upcomming.sort(reverse=True, key=lambda i: i.updated_at)
-        self.__dismissed.sort(reverse=True, key=lambda i: i.updated_at)
+            issues = []
+            for match in self.__titles.match(query):
+                if len(issues) >= n:
+                    break
+                issues.extend(self._most_recent_of(match, n - len(issues)))
+            return issues
+
+    def _most_recent_of(self, match, n):
+        if not match.estimate:
+            return []
+        # Walking the recency index finds n matches after looking at about
+        # n * len(upcomming) / len(matches) issues, which beats collecting
+        # and sorting the matches when many issues match.
+        if n * len(self.__upcomming) < match.estimate**2:
+            issues = []
+            for k in self.__recent:
+                if len(issues) >= n:
+                    break
+                if k in match:
+                    issues.append(self.__upcomming[k])
+            return issues
+        keys = heapq.nsmallest(
+            n, match.keys(), key=lambda k: RecencyIndex._entry(self.__upcomming[k])
+        )
+        return [self.__upcomming[k] for k in keys]
+
+    def count_updated_since(self, since):
+        """Return a Counter of repo -> issues updated after `since`.
+
+        Dismissed and evicted issues count too, since they show how busy a
+        repo is just the same.
+        """
+        counts = Counter()
+        with self.__lock:
+            for issues, recent in (
+                (self.__upcomming, self.__recent),
+                (self.__overflow, self.__overflow_recent),
+            ):
+                for key in recent:
+                    issue = issues[key]
+                    if issue.updated_at <= since:
+                        break
+                    counts[issue.repo] += 1
+            for issue in self.__dismissed.values():
+                if issue.updated_at > since:
+                    counts[issue.repo] += 1
+        return counts
+
+    def newest_update_time(self, repo=None):
+        """Return the newest updated_at of any issue seen, or None.
+
+        If `repo` is given, only issues in that repo are considered.
+        """
+        with self.__lock:
+            if repo is not None:
+                return self.__newest_update_time_by_repo.get(repo)
+            return self.__newest_update_time
+
+    def _most_recent_issues(
+        self, n, *, repo=None, author=None, is_pr=None, unread=None
+    ):
+        indexes = []
+        if repo is not None:
+            indexes.append(self.__by_repo.get(repo, RecencyIndex()))
+        if author is not None:
+            indexes.append(self.__by_author.get(author, RecencyIndex()))
+        if is_pr is not None:
+            indexes.append(self.__by_kind.get(is_pr, RecencyIndex()))
+        if unread:
+            indexes.append(self.__unread)
+        if not indexes:
+            if unread is None:
+                return [self.__upcomming[k] for k in self.__recent.top(n)]
+            # Read issues aren't indexed
+            indexes.append(self.__recent)
+
+        def matches(issue):
+            return (
+                (repo is None or issue.repo == repo)
+                and (author is None or issue.author == author)
+                and (is_pr is None or issue.is_pr == is_pr)
+                and (unread is None or issue.is_read != unread)
+            )
+
+        # Walk the smallest index in order, checking the other filters
+        issues = []
+        for k in min(indexes, key=len):
+            if len(issues) >= n:
+                break
+            issue = self.__upcomming[k]
+            if matches(issue):
+                issues.append(issue)
+        return issues
@@ -1,12 +1,22 @@
+import itertools
+import json
 import threading
 import time
 import logging
+from collections import defaultdict
+from collections import deque
 from gql import gql
+from gql.transport.exceptions import TransportQueryError
 from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
 from dateutil.parser import isoparse
 
 from .data import Issue
 from .data import Repository
+from .data import issue_key
+from .profiling import section
+from .refresh_scheduler import RefreshScheduler
 
 
 def _make_issue(gh_data):
@@ -28,11 +38,17 @@ def _make_issue(gh_data):
         title=gh_data["title"],
         url=gh_data["url"],
         is_read=bool(gh_data["isReadByViewer"]),
+        is_pr=gh_data["__typename"] == "PullRequest",
+        is_closed=bool(gh_data["closed"]),
+        node_id=gh_data["id"],
     )
 
 
 FRAGMENT_ISSUE = """
 fragment issueFields on Issue {
+    __typename
+    id
+    closed
     author {
         login
     }
@@ -52,6 +68,9 @@ fragment issueFields on Issue {
 """
 FRAGMENT_PR = """
 fragment prFields on PullRequest {
+    __typename
+    id
+    closed
     author {
         login
     }
@@ -71,9 +90,13 @@ fragment prFields on PullRequest {
 """
 
 
+# Most issues or PRs Github returns in one page
+PAGE_SIZE = 100
+
+
 class IssueQuery:
 
-    def __init__(self, *, first=100, after=None, states=("OPEN",)):
+    def __init__(self, *, first=PAGE_SIZE, after=None, states=("OPEN",)):
         self.first = first
         self.after = after
         self.states = states
@@ -87,14 +110,15 @@ class IssueQuery:
             parts.append(",".join(self.states))
             parts.append("]")
         parts.append(
-            ") { nodes { ...issueFields } pageInfo { endCursor hasNextPage } }"
+            ") { totalCount nodes { ...issueFields } "
+            "pageInfo { endCursor hasNextPage } }"
         )
         return "".join(parts)
 
 
 class PRQuery:
 
-    def __init__(self, *, first=100, after=None, states=("OPEN",)):
+    def __init__(self, *, first=PAGE_SIZE, after=None, states=("OPEN",)):
         self.first = first
         self.after = after
         self.states = states
@@ -107,152 +131,591 @@ class PRQuery:
             parts.append(", states: [")
             parts.append(",".join(self.states))
             parts.append("]")
-        parts.append(") { nodes { ...prFields } pageInfo { endCursor hasNextPage } }")
+        parts.append(
+            ") { totalCount nodes { ...prFields } pageInfo { endCursor hasNextPage } }"
+        )
         return "".join(parts)
 
 
+class CrawlUnit:
+    """The issues or the PRs of one repo that are left to crawl."""
+
+    _ids = itertools.count()
+
+    def __init__(self, repo, kind):
+        self.repo = repo
+        # "issues" or "pullRequests"
+        self.kind = kind
+        self.cursor = None
+        # Number of open issues or PRs, or None if not known yet
+        self.total = None
+        self.fetched = 0
+        # Name of this unit in batched queries, which maps results back to it
+        self.alias = f"u{next(self._ids)}"
+
+    def __repr__(self):
+        return f"{self.repo.owner}/{self.repo.name} {self.kind}"
+
+    def query(self):
+        if self.kind == "issues":
+            return IssueQuery(after=self.cursor)
+        return PRQuery(after=self.cursor)
+
+    def remaining(self):
+        """Return the expected number of issues or PRs left to fetch."""
+        if self.total is None:
+            return PAGE_SIZE
+        return max(self.total - self.fetched, 0)
+
+    def page_cost(self):
+        return min(PAGE_SIZE, self.remaining())
+
+
+def _batch_repos(batch):
+    return ", ".join(repr(u) for u in batch)
+
+
+def _batch_query(batch):
+    unit_queries = []
+    for u in batch:
+        unit_queries.append(
+            f'{u.alias}: repository(owner: "{u.repo.owner}", name: "{u.repo.name}")'
+            f" {{ {u.query()} }}"
+        )
+    joined_queries = "\n".join(unit_queries)
+    query_str = f"""
+        query {{
+            {joined_queries}
+        }}
+        """
+    # It's an error to include unused fragments,
+    # so only include a fragment if it's used.
+    if any(u.kind == "issues" for u in batch):
+        query_str += FRAGMENT_ISSUE
+    if any(u.kind == "pullRequests" for u in batch):
+        query_str += FRAGMENT_PR
+    return query_str
+
+
+def _nodes_query(node_ids):
+    return (
+        f"query {{ nodes(ids: {json.dumps(list(node_ids))}) "
+        "{ ...issueFields ...prFields } }" + FRAGMENT_ISSUE + FRAGMENT_PR
+    )
+
+
+def _count_query(repos):
+    repo_queries = []
+    for i, r in enumerate(repos):
+        repo_queries.append(
+            f'c{i}: repository(owner: "{r.owner}", name: "{r.name}") {{ '
+            "issues(states: [OPEN]) { totalCount } "
+            "pullRequests(states: [OPEN]) { totalCount } }"
+        )
+    joined_queries = "\n".join(repo_queries)
+    return f"query {{ {joined_queries} }}"
+
+
 class IssueLoader:
 
+    # Batches are filled up to this expected cost, where a unit costs the
+    # number of issues or PRs in its next page plus UNIT_COST.
+    BATCH_COST = 1000
+    UNIT_COST = 10
+    BATCH_UNITS = 20
+    # Number of repos to count open issues and PRs of in one query
+    COUNT_REPOS = 50
+    # How many times to try a batch before splitting it up
+    RETRIES = 3
+    # Seconds to wait after the first failure, doubling every retry
+    BACKOFF = 1.0
+    # Seconds to wait before crawling repos that failed to crawl again
+    CRAWL_RETRY_INTERVAL = 10 * 60
+    # Seconds between checking for repos that are due to be polled, which
+    # is also how often watched issues are refreshed
+    UPDATE_TICK = 5
+    # Most node IDs Github accepts in one nodes query
+    NODES_PAGE_SIZE = 100
+    # Shortest time between searches of a repo while issues are watched.
+    # Watched issues are refreshed every tick, so searches only need to
+    # find issues that aren't watched yet.
+    WATCHED_MIN_INTERVAL = 2 * 60
+    # Github limits the length of search queries
+    SEARCH_QUERY_LENGTH = 256
+    # Search for updates this long before a repo's newest known update,
+    # in case Github's search index lags behind
+    WATERMARK_OVERLAP = timedelta(minutes=1)
+    # How far back to look at a repo's issues to guess how busy it is
+    RATE_WINDOW = timedelta(days=7)
+
     def __init__(self, gql_client, repos, cache, progress_callback):
         self._client = gql_client
         self._repos = tuple(repos)
         self._cache = cache
         self._lock = threading.Lock()
         self._logger = logging.getLogger("IssueLoader")
-        self._thread = threading.Thread(daemon=True, target=self._run)
+        self._thread = threading.Thread(
+            daemon=True, target=self._run, name="IssueLoader"
+        )
         self._progress_callback = progress_callback
+
+        # Repo -> when its crawl was queued. The crawl got everything open
+        # as of then, so updates are only searched for since then.
+        self._crawl_started = {}
+        # Checkpoint of the crawl: CrawlUnits left to fetch.
+        # If the crawl is interrupted it resumes from their cursors.
+        self._queue = deque()
+        self._enqueue(self._repos)
+        # Repos that kept failing, and were given up on until the next retry
+        self._failed_repos = []
+        self._next_crawl_retry = 0
+        self._scheduler = RefreshScheduler()
+        # (repos, progress_callback, replace) from add_repos() and set_repos()
+        # that haven't been applied yet
+        self._repo_changes = []
+        self._wake = threading.Event()
+        # Node IDs of the issues the UI shows, or is about to
+        self._watched = ()
+        # Node IDs of deleted or transferred issues, which are never watched
+        self._unresolved = set()
+        self._search_min_interval = self._scheduler.min_interval
+
+    def start(self):
         self._thread.start()
 
+    def dismiss(self, issue):
+        """Does nothing, on purpose.
+
+        LoaderProcess and SyncClient have this too, to pass dismissals on to
+        caches in other processes. This loader fills the UI's own cache,
+        which already knows about the dismissal.
+        """
+
+    def add_repos(self, repos, progress_callback=None):
+        """Start loading more repos.
+
+        Repos that are already being loaded are ignored.
+        `progress_callback` is called with the progress of loading the new repos.
+        """
+        with self._lock:
+            self._repo_changes.append((tuple(repos), progress_callback, False))
+        self._wake.set()
+
+    def set_repos(self, repos, progress_callback=None):
+        """Change the repos being loaded.
+
+        Only repos that weren't already loaded are crawled. Repos that are no
+        longer wanted stop being polled, and their issues leave the cache.
+        `progress_callback` is called with the progress of loading the new repos.
+        """
+        with self._lock:
+            self._repo_changes.append((tuple(repos), progress_callback, True))
+        self._wake.set()
+
+    def set_watched(self, node_ids):
+        """Refresh these issues and PRs every tick, by their node IDs.
+
+        Searches for updates in repos run less often while anything is
+        watched.
+        """
+        with self._lock:
+            node_ids = tuple(
+                dict.fromkeys(i for i in node_ids if i and i not in self._unresolved)
+            )
+            self._watched = node_ids
+        if node_ids:
+            self._scheduler.min_interval = self.WATCHED_MIN_INTERVAL
+        else:
+            self._scheduler.min_interval = self._search_min_interval
+
     def _run(self):
+        self._crawl(self._progress_callback)
+        self._schedule_repos(self._repos)
+        while True:
+            self._wake.wait(self.UPDATE_TICK)
+            self._wake.clear()
+            self._tick()
+
+    def _tick(self):
         try:
-            self._load_all_issues(
-                repos_per_query=10, progress_callback=self._progress_callback
-            )
-        except:
+            self._change_repos()
+            self._retry_crawl()
+            # Uses search API to get updated issues and PRs
+            self._update_due_repos()
+        except Exception:
             self._logger.exception("Exception in IssueLoader thread")
-        while True:
-            time.sleep(15)
+        # Failing to refresh watched issues must not stop the searches
+        try:
+            self._refresh_watched()
+        except Exception:
+            self._logger.exception("Failed to refresh watched issues")
+
+    def _crawl(self, progress_callback):
+        finished = False
+
+        def report(progress):
+            nonlocal finished
+            finished = progress >= 1.0
+            if progress_callback:
+                progress_callback(progress)
+
+        for attempt in range(self.RETRIES):
             try:
-                # Uses search API to get updated issues and PRs
-                self._update_all_issues()
-            except:
+                self._load_all_issues(report)
+                break
+            except Exception:
                 self._logger.exception("Exception in IssueLoader thread")
+                time.sleep(self.BACKOFF * 2**attempt)
+        else:
+            self._logger.error("Giving up on the crawl until the next retry")
+        # Whatever failed is retried later, so nobody should wait for it
+        if not finished:
+            report(1.0)
+        self._next_crawl_retry = time.monotonic() + self.CRAWL_RETRY_INTERVAL
+
+    def _retry_crawl(self):
+        """Crawl repos that failed to crawl before, if it's time to."""
+        if not (self._failed_repos or self._queue):
+            return
+        if time.monotonic() < self._next_crawl_retry:
+            return
+        failed = self._failed_repos
+        self._failed_repos = []
+        self._enqueue(failed)
+        num_repos = len({u.repo for u in self._queue})
+        self._logger.info(f"Retrying the crawl of {num_repos} repos")
+        self._crawl(None)
+
+    def _change_repos(self):
+        with self._lock:
+            changes = self._repo_changes
+            self._repo_changes = []
+        if not changes:
+            return
+        wanted = dict.fromkeys(self._repos)
+        for repos, _, replace in changes:
+            if replace:
+                wanted = dict.fromkeys(repos)
+            else:
+                wanted.update(dict.fromkeys(repos))
+        known = set(self._repos)
+        removed = known.difference(wanted)
+        new_repos = [r for r in wanted if r not in known]
+        callbacks = [callback for _, callback, _ in changes if callback is not None]
+
+        def progress_callback(progress):
+            for callback in callbacks:
+                callback(progress)
+
+        self._repos = tuple(wanted)
+        if removed:
+            self._remove_repos(removed)
+        if not new_repos:
+            progress_callback(1.0)
+            return
+        self._enqueue(new_repos)
+        self._crawl(progress_callback)
+        self._schedule_repos(new_repos)
+
+    def _remove_repos(self, repos):
+        self._queue = deque(u for u in self._queue if u.repo not in repos)
+        self._failed_repos = [r for r in self._failed_repos if r not in repos]
+        for r in repos:
+            if r in self._scheduler:
+                self._scheduler.remove(r)
+            self._crawl_started.pop(r, None)
+        self._cache.remove_repos(repos)
+        self._logger.info(f"Stopped loading {len(repos)} repos")
+
+    def _schedule_repos(self, repos):
+        # Guess how busy each repo is from its recent issues
+        since = datetime.now(timezone.utc) - self.RATE_WINDOW
+        num_recent = self._cache.count_updated_since(since)
+        for r in repos:
+            self._scheduler.add(r, num_recent[r] / self.RATE_WINDOW.total_seconds())
+
+    def _watermark(self, repo):
+        # The newest open issue of a quiet repo can be years older than the
+        # crawl, and searching from it would page through everything closed
+        # since then
+        watermark = self._crawl_started.get(repo) or datetime.now(timezone.utc)
+        newest = self._cache.newest_update_time(repo=repo)
+        if newest is not None:
+            watermark = max(watermark, newest)
+        return watermark
+
+    def _enqueue(self, repos):
+        now = datetime.now(timezone.utc)
+        for r in repos:
+            self._crawl_started[r] = now
+            self._queue.append(CrawlUnit(r, "issues"))
+            self._queue.append(CrawlUnit(r, "pullRequests"))
+
+    def _count_issues(self):
+        """Count open issues and PRs of queued units that haven't been fetched.
+
+        Units with nothing open are dropped, and the rest are ordered
+        biggest first so similarly sized units share batches.
+        """
+        by_repo = defaultdict(list)
+        for u in self._queue:
+            if u.total is None:
+                by_repo[u.repo].append(u)
+        repos = list(by_repo)
+        for start in range(0, len(repos), self.COUNT_REPOS):
+            chunk = repos[start : start + self.COUNT_REPOS]
+            try:
+                with section("query build"):
+                    query = gql(_count_query(chunk))
+                with section("execute"):
+                    result = self._client.execute(query)
+            except Exception:
+                # Crawling works without counts, just less efficiently
+                self._logger.warning(
+                    f"Failed to count issues in {len(chunk)} repos", exc_info=True
+                )
+                continue
+            for i, r in enumerate(chunk):
+                counts = result.get(f"c{i}")
+                if counts is None:
+                    continue
+                for u in by_repo[r]:
+                    u.total = counts[u.kind]["totalCount"]
+        self._queue = deque(
+            sorted(
+                (u for u in self._queue if u.cursor is not None or u.remaining()),
+                key=lambda u: -u.page_cost(),
+            )
+        )
 
-    def _load_all_issues(self, repos_per_query, progress_callback=None):
-        num_repos_at_start = len(self._repos)
+    def _next_batch(self):
+        """Take units off the front of the queue until a batch is full."""
+        queue = self._queue
+        batch = [queue.popleft()]
+        cost = batch[0].page_cost() + self.UNIT_COST
+        while queue and len(batch) < self.BATCH_UNITS:
+            unit_cost = queue[0].page_cost() + self.UNIT_COST
+            if cost + unit_cost > self.BATCH_COST:
+                break
+            batch.append(queue.popleft())
+            cost += unit_cost
+        return batch
 
-        # These dicts indicate if repos have more issues or PRs to query
-        issue_page_info = {}
-        pr_page_info = {}
-        for r in self._repos:
-            # Use "None" to mean we haven't queried anything yet
-            issue_page_info[r] = {"endCursor": None}
-            pr_page_info[r] = {"endCursor": None}
+    def _load_all_issues(self, progress_callback=None):
+        self._count_issues()
+        queue = self._queue
+        # Progress is measured in issues and PRs left to fetch
+        remaining = sum(u.remaining() for u in queue)
+        total = remaining
 
-        # Outer loop runs until it finishes exploring all issues and PRs
-        # on all repos
-        next_queries = []
         issue_count = 0
         pr_count = 0
-        while issue_page_info or pr_page_info:
-            # This loop looks for repos that still need to be explored
-            for r in self._repos:
-                issue_query = None
-                pr_query = None
-                if r in issue_page_info:
-                    ipi = issue_page_info[r]
-                    issue_query = IssueQuery(after=ipi["endCursor"])
-                if r in pr_page_info:
-                    prpi = pr_page_info[r]
-                    pr_query = PRQuery(after=prpi["endCursor"])
-
-                if issue_query or pr_query:
-                    repo_query = (
-                        f'r{id(r)}: repository(owner: "{r.owner}", name: "{r.name}")'
-                    )
-                    repo_query += "{"
-                    if issue_query:
-                        repo_query += str(issue_query)
-                    if pr_query:
-                        repo_query += str(pr_query)
-                    repo_query += "}"
-                    next_queries.append(repo_query)
-
-                if len(next_queries) == repos_per_query:
-                    # Found enough repos, ditch the for loop
-                    break
+        while queue:
+            batch = self._next_batch()
+            try:
+                result, failed = self._execute_batch(batch)
+            except BaseException:
+                # Put the batch back so the crawl can resume from it
+                queue.extendleft(reversed(batch))
+                raise
 
-            # Execute the next query
-            joined_queries = "\n".join(next_queries)
-            query_str = f"""
-                query {{
-                    {joined_queries}
-                }}
-                """
-            next_queries = []
-            # It's an error to include unused fragments,
-            # so only include a fragment if it's used.
-            if issue_page_info:
-                query_str += FRAGMENT_ISSUE
-            if pr_page_info:
-                query_str += FRAGMENT_PR
-            query = gql(query_str)
-            result = self._client.execute(query)
-
-            # Figure out what repos the query included,
-            # and add the issues and PRs to the cache
-            for r in self._repos:
-                key = f"r{id(r)}"
-                if key not in result:
-                    # Query didn't include this repo
-                    continue
-                repo_result = result[key]
-                if "issues" in repo_result:
-                    for issue in repo_result["issues"]["nodes"]:
-                        self._cache.insert(_make_issue(issue))
-                        issue_count += 1
-                    if repo_result["issues"]["pageInfo"]["hasNextPage"]:
-                        issue_page_info[r] = repo_result["issues"]["pageInfo"]
+            current = 0
+            try:
+                for current, unit in enumerate(batch):
+                    before = unit.remaining()
+                    connection = (result.get(unit.alias) or {}).get(unit.kind)
+                    if connection is None:
+                        # Query failed for this repo
+                        remaining -= before
+                        continue
+                    with section("decode"):
+                        issues = [_make_issue(n) for n in connection["nodes"]]
+                    with section("cache insert"):
+                        self._cache.insert_many(issues)
+                    if unit.kind == "issues":
+                        issue_count += len(issues)
                     else:
-                        del issue_page_info[r]
-                if "pullRequests" in repo_result:
-                    for pr in repo_result["pullRequests"]["nodes"]:
-                        self._cache.insert(_make_issue(pr))
-                        pr_count += 1
-                    if repo_result["pullRequests"]["pageInfo"]["hasNextPage"]:
-                        pr_page_info[r] = repo_result["pullRequests"]["pageInfo"]
+                        pr_count += len(issues)
+                    unit.fetched += len(issues)
+                    unit.total = connection["totalCount"]
+                    if connection["pageInfo"]["hasNextPage"]:
+                        unit.cursor = connection["pageInfo"]["endCursor"]
+                        queue.append(unit)
+                        remaining += unit.remaining() - before
                     else:
-                        del pr_page_info[r]
+                        remaining -= before
+            except BaseException:
+                # Put back the units not handled yet so the crawl can resume
+                # from them
+                queue.extendleft(reversed(batch[current:]))
+                raise
+            if failed:
+                # Give up on these repos so the rest of the crawl can finish
+                # Both units of a repo fail when the repo is broken
+                failed = list(dict.fromkeys(failed))
+                self._failed_repos.extend(failed)
+                failed = set(failed)
+                remaining -= sum(u.remaining() for u in queue if u.repo in failed)
+                queue = self._queue = deque(u for u in queue if u.repo not in failed)
             if progress_callback:
-                i_max = pr_max = num_repos_at_start
-                progress_callback(
-                    (i_max - len(issue_page_info) + pr_max - len(pr_page_info))
-                    / (i_max + pr_max)
-                )
+                if queue and total:
+                    progress_callback(min(max(1 - remaining / total, 0.0), 1.0))
+                else:
+                    progress_callback(1.0)
         self._logger.info(f"Loaded {issue_count} issues and {pr_count} PRs")
+        if self._failed_repos:
+            self._logger.error(f"Failed to load repos {self._failed_repos}")
+
+    def _execute_batch(self, batch):
+        """Execute a batch of repo queries, retrying and splitting on failure.
+
+        `batch` is a list of CrawlUnits.
+        Returns the query result, and a list of repos that could not be loaded.
+        """
+        for attempt in range(self.RETRIES):
+            try:
+                with section("query build"):
+                    query = gql(_batch_query(batch))
+                with section("execute"):
+                    return self._client.execute(query), []
+            except TransportQueryError:
+                # Github says something is wrong with the query,
+                # so asking again won't help.
+                self._logger.warning(f"Query failed for {_batch_repos(batch)}")
+                break
+            except Exception:
+                self._logger.warning(
+                    f"Attempt {attempt + 1} failed for {_batch_repos(batch)}",
+                    exc_info=True,
+                )
+                time.sleep(self.BACKOFF * 2**attempt)
+        if len(batch) == 1:
+            self._logger.error(f"Giving up on {_batch_repos(batch)}")
+            return {}, [batch[0].repo]
+        # Split the batch in two to isolate the problem repo
+        half = len(batch) // 2
+        first_result, first_failed = self._execute_batch(batch[:half])
+        second_result, second_failed = self._execute_batch(batch[half:])
+        return {**first_result, **second_result}, first_failed + second_failed
 
-    def _update_all_issues(self):
+    def _update_due_repos(self):
+        due = self._scheduler.due()
+        if not due:
+            return
+        watermarks = {r: self._watermark(r) for r in due}
+        # Repos with similar watermarks share a search,
+        # so none of them re-fetch much they already have.
+        due.sort(key=lambda r: watermarks[r])
+        for repos in self._search_chunks(due):
+            updated_since = watermarks[repos[0]] - self.WATERMARK_OVERLAP
+            try:
+                issues = self._search_updated(repos, updated_since)
+            except Exception:
+                self._logger.warning(
+                    f"Search failed for {len(repos)} repos", exc_info=True
+                )
+                # Try them again later instead of every tick
+                for r in repos:
+                    self._scheduler.failed(r)
+                continue
+            num_updates = {r: 0 for r in repos}
+            for issue in issues:
+                if (
+                    issue.repo in num_updates
+                    and issue.updated_at > watermarks[issue.repo]
+                ):
+                    num_updates[issue.repo] += 1
+            with section("cache insert"):
+                self._cache.insert_many(issues)
+            for r in repos:
+                self._scheduler.polled(r, num_updates[r])
+
+    def _refresh_watched(self):
+        """Get the latest of the watched issues and PRs by their node IDs.
+
+        This also catches read state changes, which don't change updatedAt.
+        """
+        with self._lock:
+            watched = self._watched
+        for start in range(0, len(watched), self.NODES_PAGE_SIZE):
+            page = watched[start : start + self.NODES_PAGE_SIZE]
+            with section("query build"):
+                query = gql(_nodes_query(page))
+            try:
+                with section("execute"):
+                    nodes = self._client.execute(query)["nodes"]
+            except TransportQueryError as e:
+                # Github reports IDs that don't resolve as errors, and
+                # still returns the other nodes with null for those
+                nodes = (e.data or {}).get("nodes")
+                if nodes is None:
+                    raise
+            unresolved = {i for i, n in zip(page, nodes) if n is None}
+            if unresolved:
+                self._logger.info(f"Not watching deleted issues {unresolved}")
+                with self._lock:
+                    self._unresolved |= unresolved
+                    self._watched = tuple(
+                        i for i in self._watched if i not in unresolved
+                    )
+            with section("decode"):
+                issues = [_make_issue(n) for n in nodes if n]
+            with section("cache insert"):
+                self._cache.insert_many(issues)
+                self._cache.set_read_states({issue_key(i): i.is_read for i in issues})
+
+    def _search_chunks(self, repos):
+        # Leave room for the other search qualifiers
+        budget = self.SEARCH_QUERY_LENGTH - 64
+        chunk = []
+        length = 0
+        for r in repos:
+            qualifier = f"repo:{r.owner}/{r.name} "
+            if chunk and length + len(qualifier) > budget:
+                yield chunk
+                chunk = []
+                length = 0
+            chunk.append(r)
+            length += len(qualifier)
+        if chunk:
+            yield chunk
+
+    def _search_updated(self, repos, updated_since):
+        """Return issues and PRs in repos updated after a time.
 
-        updated_time = self._cache.newest_update_time().isoformat()
+        Closed issues and merged PRs are included so the cache can drop them.
+        """
+        updated_since = updated_since.astimezone(timezone.utc)
+        updated_since = updated_since.strftime("%Y-%m-%dT%H:%M:%SZ")
 
-        def make_query(extra):
-            gh_search = f"{extra} is:open updated:>{updated_time} "
-            gh_search += " ".join([f"repo:{r.owner}/{r.name}" for r in self._repos])
+        def make_query(extra, after):
+            gh_search = f"{extra} updated:>{updated_since} "
+            gh_search += " ".join([f"repo:{r.owner}/{r.name}" for r in repos])
             query_parts = ["{"]
-            query_parts.append(f'search(first: 1, query: "{gh_search}", type: ISSUE) ')
-            query_parts.append("{ nodes {...issueFields ...prFields} }")
+            query_parts.append(f'search(first: 100, query: "{gh_search}", type: ISSUE')
+            if after:
+                query_parts.append(f', after: "{after}"')
+            query_parts.append(") { nodes {...issueFields ...prFields} ")
+            query_parts.append("pageInfo { endCursor hasNextPage } }")
             query_parts.append("}")
             query_parts.append(FRAGMENT_ISSUE)
             query_parts.append(FRAGMENT_PR)
             return " ".join(query_parts)
 
-        # TODO use pagination for unlikely case of more than 100 updated issues
+        issues = []
         # Must query for issues and PRs separately
         # https://github.com/orgs/community/discussions/149046
-        issues = self._client.execute(gql(make_query("is:issue")))
-        for i in issues["search"]["nodes"]:
-            self._cache.insert(_make_issue(i))
-
-        prs = self._client.execute(gql(make_query("is:pr")))
-        for pr in prs["search"]["nodes"]:
-            self._cache.insert(_make_issue(pr))
+        for extra in ("is:issue", "is:pr"):
+            after = None
+            while True:
+                with section("query build"):
+                    query = gql(make_query(extra, after))
+                with section("execute"):
+                    result = self._client.execute(query)
+                with section("decode"):
+                    issues.extend(_make_issue(n) for n in result["search"]["nodes"])
+                page_info = result["search"]["pageInfo"]
+                if not page_info["hasNextPage"]:
+                    break
+                after = page_info["endCursor"]
+        return issues
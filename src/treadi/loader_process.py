@@ -0,0 +1,262 @@
+"""Load repos and issues in a worker process.
+
+The worker is started with `python -m treadi.loader_process` rather than
+multiprocessing so it never imports the GUI. Messages are pickled tuples,
+each prefixed with its length, sent over the worker's stdin and stdout.
+
+Parent to worker:
+    ("start", access_token, repo_loader_specs)
+    ("set_specs", repo_loader_specs)
+    ("dismiss", issue_key)
+    ("watch", [node_id, ...])
+
+Worker to parent:
+    ("repos", [Repository, ...])
+    ("issues", [issue_record, ...])
+    ("progress", progress)
+    ("dismissed", issue_key)    only from the sync daemon, for dismissals
+                                made by other instances
+"""
+
+import logging
+import os
+import pickle
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from . import profiling
+from .data import Issue
+from .data import Repository
+from .data import issue_from_record
+from .data import issue_key
+from .data import issue_to_record
+
+HEADER = struct.Struct("!I")
+
+
+class Channel:
+    """Sends and receives messages over a pair of binary streams."""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._writer.write(HEADER.pack(len(data)))
+            self._writer.write(data)
+            self._writer.flush()
+
+    def _read_exactly(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self._reader.read(size - len(data))
+            if not chunk:
+                raise EOFError("Channel closed")
+            data += chunk
+        return data
+
+    def recv(self):
+        (size,) = HEADER.unpack(self._read_exactly(HEADER.size))
+        return pickle.loads(self._read_exactly(size))
+
+
+class BatchSender:
+    """Batches changed issues from a cache into "issues" messages.
+
+    A batch is sent when it's big enough, or when it's been waiting
+    for `max_delay` seconds.
+    """
+
+    def __init__(self, channel, batch_size=500, max_delay=0.1):
+        self._channel = channel
+        self._batch_size = batch_size
+        self._max_delay = max_delay
+        self._records = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            daemon=True, target=self._run, name="BatchSender"
+        )
+        self._thread.start()
+
+    def add(self, issues):
+        with self._lock:
+            if self._closed:
+                return
+            self._records.extend(issue_to_record(i) for i in issues)
+            if len(self._records) < self._batch_size:
+                return
+            self._flush()
+
+    def progress(self, progress):
+        self.send(("progress", progress))
+
+    def send(self, message):
+        """Send a message after the issues that came before it."""
+        with self._lock:
+            if self._closed:
+                return
+            self._flush()
+            self._channel.send(message)
+
+    def close(self):
+        """Stop sending, such as when the other end went away."""
+        with self._lock:
+            self._closed = True
+            self._records = []
+
+    def _flush(self):
+        if self._records and not self._closed:
+            self._channel.send(("issues", self._records))
+            self._records = []
+
+    def _run(self):
+        while not self._closed:
+            time.sleep(self._max_delay)
+            with self._lock:
+                self._flush()
+
+
+def _serve(channel):
+    # Runs in the worker process.
+    # These are imported here so the parent doesn't need them to start a worker.
+    from .client import make_gql_client
+    from .issue_cache import IssueCache
+    from .issue_loader import IssueLoader
+    from .repo_loader import make_repo_loader
+
+    _, access_token, specs = channel.recv()
+    gql_client = make_gql_client(access_token)
+    cache = IssueCache()
+    sender = BatchSender(channel)
+    cache.add_listener(sender.add)
+
+    repos = make_repo_loader(specs, gql_client).load_repos()
+    sender.send(("repos", repos))
+    loader = IssueLoader(gql_client, repos, cache, sender.progress)
+    loader.start()
+
+    while True:
+        try:
+            message = channel.recv()
+        except EOFError:
+            # The parent went away
+            return
+        match message:
+            case ("dismiss", (owner, name, number)):
+                cache.dismiss(
+                    Issue(repo=Repository(owner=owner, name=name), number=number)
+                )
+            case ("set_specs", specs):
+                repos = make_repo_loader(specs, gql_client).load_repos()
+                # The parent dropped its issues when it asked, so it gets
+                # what's cached for the repos that are kept again
+                sender.send(("repos", repos))
+                for r in repos:
+                    sender.add(cache.most_recent_issues(n=sys.maxsize, repo=r))
+                loader.set_repos(repos, sender.progress)
+            case ("watch", node_ids):
+                loader.set_watched(node_ids)
+
+
+class LoaderProcess:
+    """Loads repos and issues in a worker process into a local IssueCache.
+
+    This has the same interface as IssueLoader, so the UI can use either.
+    """
+
+    def __init__(self, access_token, specs, cache, progress_callback):
+        self._access_token = access_token
+        self._specs = specs
+        self._cache = cache
+        self._progress_callback = progress_callback
+        self._process = None
+        self._channel = None
+        # Repos the other end is loading, once it says
+        self._repos = None
+        self._logger = logging.getLogger("LoaderProcess")
+        self._thread = threading.Thread(
+            daemon=True, target=self._receive, name="LoaderProcess"
+        )
+
+    def start(self):
+        self._channel = self._connect()
+        self._channel.send(("start", self._access_token, self._specs))
+        self._thread.start()
+
+    def _connect(self):
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "treadi.loader_process"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        return Channel(self._process.stdout, self._process.stdin)
+
+    def dismiss(self, issue):
+        self._channel.send(("dismiss", issue_key(issue)))
+
+    def set_watched(self, node_ids):
+        self._channel.send(("watch", list(node_ids)))
+
+    def set_specs(self, specs, progress_callback):
+        """Change the repos being loaded, like IssueLoader.set_repos().
+
+        Issues of the old repos are dropped right away. The other end
+        sends the issues of the repos that are kept again along with the
+        new repos.
+        """
+        self._progress_callback = progress_callback
+        if self._repos is not None:
+            old_repos = self._repos
+            # Ignores updates until the new repos are known
+            self._repos = frozenset()
+            self._cache.remove_repos(old_repos)
+        self._channel.send(("set_specs", specs))
+
+    def _receive(self):
+        while True:
+            try:
+                message = self._channel.recv()
+            except EOFError:
+                self._logger.error("Loader process exited")
+                return
+            match message:
+                case ("repos", repos):
+                    repos = frozenset(repos)
+                    if self._repos is not None:
+                        self._cache.remove_repos(self._repos - repos)
+                    self._repos = repos
+                case ("issues", records):
+                    with profiling.section("decode"):
+                        issues = [issue_from_record(r) for r in records]
+                        # Changes to repos that were just removed may still arrive
+                        if self._repos is not None:
+                            issues = [i for i in issues if i.repo in self._repos]
+                    with profiling.section("cache insert"):
+                        self._cache.insert_many(issues)
+                case ("progress", progress):
+                    self._progress_callback(progress)
+                case ("dismissed", (owner, name, number)):
+                    self._cache.dismiss(
+                        Issue(repo=Repository(owner=owner, name=name), number=number)
+                    )
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    # Inherits TREADI_PROFILE from the parent
+    profiling.start_from_environment()
+    # Messages go over stdout, so keep everything else from printing to it
+    writer = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    _serve(Channel(sys.stdin.buffer, writer))
+
+
+if __name__ == "__main__":
+    main()
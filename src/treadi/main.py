@@ -1,3 +1,7 @@
+import time
+
+START_TIME = time.perf_counter()
+
 import kivy
 
 kivy.require("2.3.1")
@@ -6,60 +10,108 @@ from kivy.animation import Animation
 from kivy.app import App
 from kivy.clock import Clock
 from kivy.config import Config
+from kivy.logger import Logger
 
 Config.set("graphics", "resizable", False)
 Config.set("input", "mouse", "mouse,disable_multitouch")
 from kivy.core.window import Window
 
-Window.size = (500, 518)
+# Five issue cards, plus the Change repos button above them
+Window.size = (500, 518 + 18)
+from kivy.properties import BooleanProperty
 from kivy.properties import ColorProperty
 from kivy.properties import NumericProperty
 from kivy.properties import ObjectProperty
+from kivy.properties import StringProperty
 
 from kivy.uix.behaviors import ButtonBehavior
 from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.label import Label
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivy.uix.stacklayout import StackLayout
 from kivy.uix.widget import Widget
 from kivy.uix.screenmanager import ScreenManager, Screen
 
+import os
 import urllib
 import webbrowser
-import requests
 import threading
-import time
-import pathlib
 
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from concurrent.futures import ThreadPoolExecutor
 
 from . import auth
+from . import frame_timing
+from . import profiling
+from .client import load_schema
+from .client import make_gql_client
 from .data import Issue
 from .data import is_same_issue
+from .data import issue_key
 from .issue_cache import IssueCache
 from .issue_loader import IssueLoader
-from .repo_loader import CurrentUserRepoLoader
-from .repo_loader import OrgRepoLoader
-from .repo_loader import FileRepoLoader
-from .repo_loader import SequentialRepoLoaders
-from .repo_loader import VcsRepoLoader
+from .notifications import NotificationPoller
+from .notifications import token_from_environment
+from .loader_process import LoaderProcess
+from .sync_daemon import SyncClient
+from .repo_loader import PRESETS
+from .repo_loader import make_repo_loader
+from .texture_cache import TextureCache
 
 
 USERNAME = None
 REPOS = None
 ISSUES = None
 
-
-def make_gql_client(access_token):
-    transport = RequestsHTTPTransport(
-        url="https://api.github.com/graphql",
-        headers={
-            "Authorization": f"bearer {access_token}",
-        },
-        verify=True,
-        retries=3,
-    )
-    schema_path = pathlib.Path(__file__).parent.resolve() / "schema.docs.graphql"
-    return Client(transport=transport, schema=schema_path.read_text())
+# "stack" shows a fixed number of issues, "recycle" shows a scrollable list
+ISSUE_LIST_MODE = os.environ.get("TREADI_ISSUE_LIST", "stack")
+# Load issues in a worker process, so the UI doesn't compete for the GIL
+LOADER_PROCESS = os.environ.get("TREADI_LOADER_PROCESS", "") == "1"
+# Share loaders with other TreadI instances through the sync daemon
+SYNC_DAEMON = os.environ.get("TREADI_SYNC", "") == "1"
+# Maximum number of not dismissed issues to keep in memory
+MAX_ISSUES = int(os.environ.get("TREADI_MAX_ISSUES", "0")) or None
+# Number of rendered labels to keep for reuse by issue cards
+TEXTURES = TextureCache(int(os.environ.get("TREADI_TEXTURE_CACHE", "512")))
+# Log frames that take longer than this many milliseconds, 0 turns frame
+# timing off
+LONG_FRAME_MS = float(os.environ.get("TREADI_LONG_FRAME_MS", "50"))
+
+
+class CachedLabel(Label):
+    """A Label that reuses textures already rendered by any CachedLabel."""
+
+    # Identifies the text being rendered, or None to not cache it
+    cache_key = ObjectProperty(None, allownone=True)
+
+    def texture_update(self, *largs):
+        key = self._texture_key()
+        if key is not None:
+            texture = TEXTURES.get(key)
+            if texture is not None:
+                self.texture = texture
+                self.texture_size = list(texture.size)
+                return
+        super().texture_update(*largs)
+        if key is not None and self.texture is not None:
+            TEXTURES.put(key, self.texture)
+            # The core label re-renders into its texture in place when the
+            # size doesn't change, which would overwrite the cached one
+            self._label.texture = None
+
+    def _texture_key(self):
+        if self.cache_key is None:
+            return None
+        # The same text renders differently if the label changed
+        return (
+            self.cache_key,
+            tuple(self.text_size),
+            self.font_size,
+            self.bold,
+            tuple(self.color),
+            self.halign,
+            self.valign,
+            self.max_lines,
+        )
 
 
 class IssueWidget(ButtonBehavior, BoxLayout):
@@ -71,8 +123,13 @@ class IssueWidget(ButtonBehavior, BoxLayout):
         rebind=True,
     )
 
-    def __init__(self, issue, dismiss_callback, **kwargs):
-        self.issue = issue
+    # Set while the card animates away. Its labels render at every size it
+    # passes through, which isn't worth caching.
+    dismissed = BooleanProperty(False)
+
+    def __init__(self, issue=None, dismiss_callback=None, **kwargs):
+        if issue is not None:
+            self.issue = issue
         self.dismiss_callback = dismiss_callback
         super().__init__(**kwargs)
 
@@ -84,48 +141,134 @@ class IssueWidget(ButtonBehavior, BoxLayout):
         # Oh yeah, the whole point is to open the issue
         if self.last_touch.button == "left":
             webbrowser.open(self.issue.url)
+            # Assume the user read it rather than waiting to hear from Github
+            App.get_running_app().issue_cache.set_read_states(
+                {issue_key(self.issue): True}
+            )
 
     def do_dismiss_callback(self):
         # Only dismiss once
         if self.dismiss_callback is not None:
             d = self.dismiss_callback
             self.dismiss_callback = None
+            self.dismissed = True
             d(self)
 
 
-class IssueScreen(Screen):
+class LiveIssueScreen(Screen):
+    """A screen that updates itself when the issue cache changes."""
+
+    # Number of the most recent issues the loader keeps extra fresh, which
+    # covers the ones shown and the next few to be revealed
+    num_watched = NumericProperty(10)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Coalesces any number of cache changes into one update per frame
+        self._trigger_update = Clock.create_trigger(self._rebuild)
+        self._watched = None
 
     def on_pre_enter(self):
-        issue_cache = App.get_running_app().issue_cache
-        issues = issue_cache.most_recent_issues(n=5)
-        for i in issues:
-            self._add_issue(i)
+        App.get_running_app().issue_cache.add_listener(self._on_cache_changed)
+        self._rebuild()
 
-    def _add_issue(self, issue):
-        self.ids.stack.add_widget(IssueWidget(issue, self.dismiss))
+    def on_leave(self):
+        App.get_running_app().issue_cache.remove_listener(self._on_cache_changed)
 
-    def dismiss(self, issue_widget):
-        issue = issue_widget.issue
+    def _on_cache_changed(self, issues):
+        # Called from the loader thread
+        self._trigger_update()
+
+    def _rebuild(self, *args):
+        with profiling.section("ui rebuild"):
+            self._update_issues()
+            self._watch()
+
+    def _watch(self):
+        app = App.get_running_app()
+        if app.issue_loader is None:
+            return
+        issues = app.issue_cache.most_recent_issues(n=self.num_watched)
+        node_ids = [i.node_id for i in issues]
+        if node_ids != self._watched:
+            self._watched = node_ids
+            app.issue_loader.set_watched(node_ids)
+
+    def _update_issues(self, *args):
+        """Make the screen show the most recent issues in the cache.
+
+        Subclasses must implement this. It's called on the main thread,
+        at most once per frame however many times the cache changed.
+        """
+        raise NotImplementedError
+
+    def change_repos(self):
+        # The repo picker removes itself when it's done
+        if not self.manager.has_screen("repos"):
+            self.manager.add_widget(RepoPickerScreen(name="repos"))
+        self.manager.transition.direction = "right"
+        self.manager.current = "repos"
+
+
+class IssueScreen(LiveIssueScreen):
+
+    num_issues = NumericProperty(5)
+
+    def _update_issues(self, *args):
+        """Make the displayed issues match the most recent issues in the cache.
+
+        Existing widgets are updated and reordered rather than recreated.
+        """
         issue_cache = App.get_running_app().issue_cache
+        issues = issue_cache.most_recent_issues(n=self.num_issues)
+        stack = self.ids.stack
+
+        # Widgets being animated away after a dismissal are left alone
+        widgets = {}
+        for child in stack.children:
+            if child.dismiss_callback is not None:
+                widgets[issue_key(child.issue)] = child
+
+        wanted = []
+        for issue in issues:
+            widget = widgets.pop(issue_key(issue), None)
+            if widget is None:
+                with profiling.section("widget creation"):
+                    widget = IssueWidget(issue, self.dismiss)
+            elif widget.issue != issue:
+                widget.issue = issue
+            wanted.append(widget)
+
+        for widget in widgets.values():
+            stack.remove_widget(widget)
+
+        # Widgets being animated away keep their place, and the wanted
+        # widgets fill the other places in order
+        wanted_widgets = iter(wanted)
+        target = [
+            c if c.dismiss_callback is None else next(wanted_widgets)
+            for c in reversed(stack.children)
+        ]
+        target.extend(wanted_widgets)
+        # Only move widgets that aren't in place, so the rest don't jump.
+        # Children are in reverse order of display.
+        for position, widget in enumerate(target):
+            children = stack.children
+            if widget.parent is not None:
+                if len(children) - 1 - children.index(widget) == position:
+                    continue
+                stack.remove_widget(widget)
+            stack.add_widget(widget, index=len(stack.children) - position)
 
-        issue_cache.dismiss(issue)
-
-        child_issues = []
-        for child in self.ids.stack.children:
-            if hasattr(child, "issue"):
-                child_issues.append(child.issue)
-
-        # aim for 1 additional issue, because one is being dismissed
-        consider_issues = issue_cache.most_recent_issues(n=1 + len(child_issues))
-        for itc in consider_issues:
-            displaying_issue = False
-            for chi in child_issues:
-                if is_same_issue(itc, chi):
-                    displaying_issue = True
-                    break
-            if not displaying_issue:
-                self._add_issue(itc)
-                break
+    def dismiss(self, issue_widget):
+        with profiling.section("dismiss"):
+            self._dismiss(issue_widget)
+
+    def _dismiss(self, issue_widget):
+        issue = issue_widget.issue
+        App.get_running_app().dismiss_issue(issue)
+        # Reveal the next issue right away instead of waiting for the next frame
+        self._rebuild()
 
         # Animate the dismissed widget shrinking, so new issue reveals from below
         anim = Animation(
@@ -135,54 +278,97 @@ class IssueScreen(Screen):
         anim.start(issue_widget)
 
 
+class RecycledIssueWidget(RecycleDataViewBehavior, IssueWidget):
+    """An IssueWidget that a RecycleView reuses for different issues."""
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.color = self.property("color").defaultvalue
+        self.dismissed = False
+        return super().refresh_view_attrs(rv, index, data)
+
+
+class IssueListScreen(LiveIssueScreen):
+    """Scrollable list of issues where only the visible cards are widgets."""
+
+    page_size = NumericProperty(50)
+
+    def _update_issues(self, *args):
+        issue_cache = App.get_running_app().issue_cache
+        data = self.ids.rv.data
+        issues = issue_cache.most_recent_issues(n=max(len(data), self.page_size))
+        if [d["issue"] for d in data] != issues:
+            # The RecycleView only rebinds the visible views to the new data
+            self.ids.rv.data = [self._view_data(i) for i in issues]
+
+    def _view_data(self, issue):
+        return {"issue": issue, "dismiss_callback": self.dismiss}
+
+    def on_scroll(self, scroll_y):
+        # Load another page when the user scrolls near the bottom
+        if scroll_y > 0.05:
+            return
+        data = self.ids.rv.data
+        issue_cache = App.get_running_app().issue_cache
+        issues = issue_cache.most_recent_issues(n=len(data) + self.page_size)
+        data.extend(self._view_data(i) for i in issues[len(data) :])
+
+    def dismiss(self, issue_widget):
+        issue = issue_widget.issue
+        app = App.get_running_app()
+        issue_cache = app.issue_cache
+        app.dismiss_issue(issue)
+
+        data = self.ids.rv.data
+        for index, d in enumerate(data):
+            if is_same_issue(d["issue"], issue):
+                del data[index]
+                break
+
+        # Keep the list the same length by adding the next issue to the end
+        consider_issues = issue_cache.most_recent_issues(n=1 + len(data))
+        if len(consider_issues) > len(data):
+            data.append(self._view_data(consider_issues[-1]))
+
+
 class RepoPickerScreen(Screen):
 
+    def use_preset(self, preset):
+        app = App.get_running_app()
+        specs = PRESETS[preset]
+        if SYNC_DAEMON or LOADER_PROCESS:
+            # The daemon or worker process loads the repos too
+            loader_class = SyncClient if SYNC_DAEMON else LoaderProcess
+
+            def _make_loader(progress_callback):
+                if app.issue_loader is not None:
+                    app.issue_loader.set_specs(specs, progress_callback)
+                    return app.issue_loader
+                loader = loader_class(
+                    app.access_token, specs, app.issue_cache, progress_callback
+                )
+                loader.start()
+                return loader
+
+            self.manager.switch_to(IssueLoadingScreen(_make_loader))
+        else:
+            self.manager.switch_to(
+                RepoLoadingScreen(make_repo_loader(specs, app.gql_client))
+            )
+
     def use_all_user_repos(self):
-        self.manager.switch_to(
-            RepoLoadingScreen(CurrentUserRepoLoader(App.get_running_app().gql_client))
-        )
+        self.use_preset("user")
 
     def use_all_gazebo_repos(self):
-        self.manager.switch_to(
-            RepoLoadingScreen(
-                SequentialRepoLoaders(
-                    repo_loaders=[
-                        OrgRepoLoader("gazebosim", App.get_running_app().gql_client),
-                        OrgRepoLoader(
-                            "gazebo-tooling", App.get_running_app().gql_client
-                        ),
-                        OrgRepoLoader(
-                            "gazebo-release", App.get_running_app().gql_client
-                        ),
-                    ],
-                )
-            )
-        )
+        self.use_preset("gazebo")
 
     def use_all_rmf_repos(self):
-        self.manager.switch_to(
-            RepoLoadingScreen(
-                OrgRepoLoader("open-rmf", App.get_running_app().gql_client)
-            )
-        )
+        self.use_preset("rmf")
 
     def use_all_infra_repos(self):
-        self.manager.switch_to(
-            RepoLoadingScreen(
-                VcsRepoLoader(
-                    "https://raw.githubusercontent.com/ros-infrastructure/ci/refs/heads/main/ros-infrastructure.repos"
-                )
-            )
-        )
+        self.use_preset("infra")
 
     def use_all_ros_repos(self):
-        self.manager.switch_to(
-            RepoLoadingScreen(
-                FileRepoLoader(
-                    pathlib.Path(__file__).parent.resolve() / "ros_pmc_repos.txt"
-                )
-            )
-        )
+        self.use_preset("ros")
 
 
 class RepoLoadingScreen(Screen):
@@ -194,8 +380,20 @@ class RepoLoadingScreen(Screen):
 
     def switch_to_issue_loading(self, repos):
 
+        def _make_loader(progress_callback):
+            app = App.get_running_app()
+            if app.issue_loader is not None:
+                # Only crawl the repos that weren't loaded already
+                app.issue_loader.set_repos(repos, progress_callback)
+                return app.issue_loader
+            loader = IssueLoader(
+                app.gql_client, repos, app.issue_cache, progress_callback
+            )
+            loader.start()
+            return loader
+
         def _switch(dt):
-            self.manager.switch_to(IssueLoadingScreen(repos))
+            self.manager.switch_to(IssueLoadingScreen(_make_loader))
 
         Clock.schedule_once(lambda dt: self._loader.cleanup())
         Clock.schedule_once(_switch)
@@ -205,13 +403,10 @@ class IssueLoadingScreen(Screen):
 
     progress = NumericProperty(0.0)
 
-    def __init__(self, repos, **kwargs):
-        App.get_running_app().issue_loader = IssueLoader(
-            App.get_running_app().gql_client,
-            repos,
-            App.get_running_app().issue_cache,
-            self.update_progress,
-        )
+    def __init__(self, make_loader, **kwargs):
+        # make_loader(progress_callback) returns a started IssueLoader or
+        # LoaderProcess
+        App.get_running_app().issue_loader = make_loader(self.update_progress)
         super().__init__(**kwargs)
 
     def update_progress(self, progress):
@@ -221,8 +416,9 @@ class IssueLoadingScreen(Screen):
 
     def switch_to_issues(self):
         # Must only be called on main thread
-        self.manager.transition.direction = "left"
-        self.manager.current = "issues"
+        App.get_running_app().start_notification_poller()
+        # Removes this screen once the transition finishes
+        self.manager.switch_to(self.manager.get_screen("issues"), direction="left")
 
 
 class LoginScreen(Screen):
@@ -272,19 +468,45 @@ class LoginScreen(Screen):
                 )
 
 
+class StartupScreen(Screen):
+
+    message = StringProperty("Starting TreadI")
+
+
 class TreadIApp(App):
 
+    access_token = None
     gql_client = None
     issue_loader = None
-    issue_cache = IssueCache()
+    issue_cache = IssueCache(max_upcomming=MAX_ISSUES)
+    frame_timer = None
+    notification_poller = None
+    schema = None
     sm = None
 
     def make_client_from_response(self, token_response):
         if token_response.status == auth.Status.ACCESS_GRANTED:
-            self.gql_client = make_gql_client(token_response.access_token)
+            self.access_token = token_response.access_token
+            self.gql_client = make_gql_client(
+                token_response.access_token, schema=self.schema
+            )
             return True
         return False
 
+    def dismiss_issue(self, issue):
+        self.issue_cache.dismiss(issue)
+        if self.issue_loader is not None:
+            self.issue_loader.dismiss(issue)
+
+    def start_notification_poller(self):
+        # Keeps read state in sync once the initial crawl is done
+        notifications_token = token_from_environment()
+        if self.notification_poller is None and notifications_token:
+            self.notification_poller = NotificationPoller(
+                notifications_token, self.issue_cache
+            )
+            self.notification_poller.start()
+
     def on_login_result(self, _, token_response):
         if self.make_client_from_response(token_response):
             auth.store_refresh_token(token_response.refresh_token)
@@ -298,22 +520,73 @@ class TreadIApp(App):
     def build(self):
         # Window.always_on_top = True
 
+        if LONG_FRAME_MS > 0:
+            self.frame_timer = frame_timing.start(LONG_FRAME_MS / 1000)
+
         self.sm = ScreenManager()
+        self.sm.add_widget(StartupScreen(name="startup"))
 
-        token_response = auth.cycle_cached_token()
-        if not self.make_client_from_response(token_response):
+        Window.bind(on_flip=self._on_first_frame)
+        threading.Thread(target=self._start_up, daemon=True, name="StartUp").start()
+
+        return self.sm
+
+    def on_stop(self):
+        if self.frame_timer is not None:
+            Logger.info(f"TreadI: Frame times\n{self.frame_timer.summary()}")
+
+    def _on_first_frame(self, *args):
+        Window.unbind(on_flip=self._on_first_frame)
+        Logger.info(
+            f"TreadI: First frame after {time.perf_counter() - START_TIME:.3f}s"
+        )
+
+    def _start_up(self):
+        # Runs in a background thread so the window can draw the startup screen.
+        # The keyring read + token refresh and the schema parsing are
+        # independent, so do them at the same time.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            schema = executor.submit(load_schema)
+            token_response = executor.submit(auth.cycle_cached_token)
+            try:
+                token_response = token_response.result()
+            except Exception:
+                Logger.exception("TreadI: Failed to refresh cached token")
+                token_response = auth.TokenResponse(status=auth.Status.OTHER_ERROR)
+            try:
+                self.schema = schema.result()
+            except Exception as e:
+                Logger.exception("TreadI: Failed to load the GraphQL schema")
+                message = f"Failed to start TreadI\n{e}"
+                Clock.schedule_once(lambda dt: self._show_start_up_error(message))
+                return
+        self.make_client_from_response(token_response)
+        Clock.schedule_once(lambda dt: self._finish_start_up())
+
+    def _show_start_up_error(self, message):
+        self.sm.get_screen("startup").message = message
+
+    def _finish_start_up(self):
+        # Must only be called on main thread
+        self.sm.add_widget(RepoPickerScreen(name="repos"))
+        if ISSUE_LIST_MODE == "recycle":
+            self.sm.add_widget(IssueListScreen(name="issues"))
+        else:
+            self.sm.add_widget(IssueScreen(name="issues"))
+        self.sm.transition.direction = "left"
+        if self.gql_client is None:
             # Ask user to login
-            login_screen = LoginScreen()
+            login_screen = LoginScreen(name="login")
             login_screen.bind(token_response=self.on_login_result)
             self.sm.add_widget(login_screen)
-
-        self.sm.add_widget(RepoPickerScreen(name="repos"))
-        self.sm.add_widget(IssueScreen(name="issues"))
-
-        return self.sm
+            self.sm.current = "login"
+        else:
+            self.sm.current = "repos"
+        Logger.info(f"TreadI: Started up after {time.perf_counter() - START_TIME:.3f}s")
 
 
 def main():
+    profiling.start_from_environment()
     TreadIApp().run()
 
 
@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+
+NOTIFICATIONS_URL = "https://api.github.com/notifications"
+
+
+def token_from_environment():
+    """Return a token that can read notifications, or None.
+
+    The tokens TreadI gets by logging in as a Github App can't read
+    notifications, so syncing read state needs a separate token, such as a
+    classic personal access token with the notifications scope.
+    """
+    return os.environ.get("TREADI_NOTIFICATIONS_TOKEN") or None
+
+
+def read_states_from_notifications(notifications):
+    """Return a dict of issue key -> is_read from Github notifications."""
+    read_states = {}
+    for n in notifications:
+        if n["subject"]["type"] not in ("Issue", "PullRequest"):
+            continue
+        url = n["subject"].get("url")
+        if not url:
+            continue
+        owner, name = n["repository"]["full_name"].split("/")
+        number = int(url.rstrip("/").split("/")[-1])
+        read_states[(owner, name, number)] = not n["unread"]
+    return read_states
+
+
+class NotificationPoller:
+    """Syncs read state into the cache using Github's notifications API.
+
+    Polls are conditional on the Last-Modified time of the previous poll,
+    so polls when nothing changed return 304 and don't count against
+    the rate limit.
+    """
+
+    # Most pages of notifications to read in one poll
+    MAX_PAGES = 10
+    # Longest time to wait between polls after failures
+    MAX_BACKOFF = 30 * 60
+
+    def __init__(self, access_token, cache):
+        self._cache = cache
+        self._session = requests.Session()
+        self._session.headers.update(
+            {
+                "Authorization": f"bearer {access_token}",
+                "Accept": "application/vnd.github+json",
+            }
+        )
+        self._last_modified = None
+        # Github tells us how often we're allowed to poll with X-Poll-Interval
+        self._poll_interval = 60
+        self._logger = logging.getLogger("NotificationPoller")
+        self._thread = threading.Thread(
+            daemon=True, target=self._run, name="NotificationPoller"
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        failures = 0
+        while True:
+            try:
+                if not self.poll():
+                    return
+                failures = 0
+            except Exception:
+                failures += 1
+                self._logger.warning("Failed to poll notifications", exc_info=True)
+            # Wait longer after every failure in a row
+            time.sleep(min(self._poll_interval * 2**failures, self.MAX_BACKOFF))
+
+    def poll(self):
+        """Poll notifications once.
+
+        Returns False if polling should stop.
+        """
+        headers = {}
+        if self._last_modified is not None:
+            headers["If-Modified-Since"] = self._last_modified
+        r = self._session.get(
+            NOTIFICATIONS_URL, params={"all": "true", "per_page": 100}, headers=headers
+        )
+        if "X-Poll-Interval" in r.headers:
+            self._poll_interval = int(r.headers["X-Poll-Interval"])
+        if r.status_code == 304:
+            # Nothing changed
+            return True
+        if r.status_code in (401, 403):
+            # Github App tokens may not be allowed to read notifications
+            self._logger.error(f"Not allowed to read notifications {r}")
+            return False
+        r.raise_for_status()
+        last_modified = r.headers.get("Last-Modified")
+        notifications = r.json()
+        for _ in range(self.MAX_PAGES - 1):
+            next_page = r.links.get("next")
+            if next_page is None:
+                break
+            r = self._session.get(next_page["url"])
+            r.raise_for_status()
+            notifications.extend(r.json())
+        # Only skip what was read next time once every page was read
+        self._last_modified = last_modified
+        changed = self._cache.set_read_states(
+            read_states_from_notifications(notifications)
+        )
+        self._logger.info(f"Updated read state of {changed} issues")
+        return True
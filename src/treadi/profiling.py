@@ -0,0 +1,149 @@
+"""A sampling profiler for all of TreadI's threads.
+
+Set TREADI_PROFILE to a directory, or pass --profile to treadi-headless,
+to sample the stack of every thread while TreadI runs. On exit this writes
+one file per thread of folded stacks, which flamegraph.pl and speedscope
+can read, and a summary of the time spent in labeled sections.
+
+Code labels hot sections with `section()`. Labels show up as the root
+frames of the folded stacks, so a flame graph groups samples by section.
+The UI's frame timer uses the same labels, see `treadi.frame_timing`.
+"""
+
+import atexit
+import contextlib
+import os
+import pathlib
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from collections import defaultdict
+
+
+_profiler = None
+# Everything told about sections, see observe()
+_observers = ()
+
+
+class Profiler:
+
+    def __init__(self, directory, interval=0.005):
+        self._directory = pathlib.Path(directory)
+        self._interval = interval
+        # Thread ident -> stack of section labels that thread is in
+        self._sections = {}
+        # Thread name -> Counter of folded stacks
+        self._samples = defaultdict(Counter)
+        # Thread name -> label -> [total seconds, count]
+        self._section_times = defaultdict(lambda: defaultdict(lambda: [0.0, 0]))
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(daemon=True, target=self._run, name="Profiler")
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        self.write()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self.sample()
+
+    def sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self._thread.ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = getattr(code, "co_qualname", code.co_name)
+                filename = os.path.basename(code.co_filename)
+                stack.append(f"{name} ({filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.reverse()
+            labels = [f"[{label}]" for label in self._sections.get(ident, ())]
+            folded = ";".join(labels + stack)
+            with self._lock:
+                self._samples[names.get(ident, str(ident))][folded] += 1
+
+    def enter(self, label):
+        self._sections.setdefault(threading.get_ident(), []).append(label)
+
+    def exit(self, label, seconds):
+        self._sections[threading.get_ident()].pop()
+        with self._lock:
+            times = self._section_times[threading.current_thread().name][label]
+            times[0] += seconds
+            times[1] += 1
+
+    def write(self):
+        self._directory.mkdir(parents=True, exist_ok=True)
+        prefix = f"treadi-{os.getpid()}"
+        with self._lock:
+            for thread_name, samples in self._samples.items():
+                filename = re.sub(r"[^\w.-]", "_", thread_name) + ".folded"
+                path = self._directory / f"{prefix}-{filename}"
+                with path.open("w") as f:
+                    for folded, count in samples.most_common():
+                        f.write(f"{folded} {count}\n")
+            with (self._directory / f"{prefix}-sections.txt").open("w") as f:
+                for thread_name, sections in self._section_times.items():
+                    f.write(f"{thread_name}\n")
+                    for label, (seconds, count) in sorted(
+                        sections.items(), key=lambda item: -item[1][0]
+                    ):
+                        f.write(f"    {label}: {seconds:.3f}s in {count} calls\n")
+
+
+def start(directory, interval=0.005):
+    """Start profiling all threads, writing results to `directory` on exit."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(directory, interval)
+        _profiler.start()
+        observe(_profiler)
+    return _profiler
+
+
+def observe(observer):
+    """Tell `observer` about every section from now on.
+
+    `observer.enter(label)` is called on entering a section, and
+    `observer.exit(label, seconds)` on leaving it, both on the thread
+    running the section.
+    """
+    global _observers
+    _observers = _observers + (observer,)
+
+
+def start_from_environment():
+    directory = os.environ.get("TREADI_PROFILE")
+    if directory:
+        start(directory)
+
+
+@contextlib.contextmanager
+def section(label):
+    """Label a section of code for the profiler.
+
+    Does nothing if neither profiling nor frame timing is enabled.
+    """
+    observers = _observers
+    if not observers:
+        yield
+        return
+    for observer in observers:
+        observer.enter(label)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start_time
+        for observer in observers:
+            observer.exit(label, seconds)
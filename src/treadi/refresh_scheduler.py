@@ -0,0 +1,81 @@
+import time
+
+
+class RefreshScheduler:
+    """Decides when to poll each repo for updates.
+
+    Each repo's update rate is tracked as an exponentially weighted moving
+    average, and a repo is polled about as often as it's expected to
+    have one new update. Busy repos are polled every `min_interval` seconds,
+    and quiet repos every `max_interval` seconds.
+    """
+
+    # Weight given to the newest observation of a repo's update rate
+    ALPHA = 0.3
+
+    def __init__(self, *, min_interval=15, max_interval=15 * 60, now=time.monotonic):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._now = now
+        # Repo -> updates per second
+        self._rates = {}
+        self._last_poll = {}
+        self._next_poll = {}
+        # Repo -> number of polls in a row that failed
+        self._failures = {}
+
+    def add(self, repo, rate=None):
+        """Start scheduling a repo.
+
+        `rate` is an initial guess of updates per second. If it's not given
+        the repo is assumed to be busy until polls show otherwise.
+        """
+        if rate is None:
+            rate = 1 / self.min_interval
+        now = self._now()
+        self._rates[repo] = rate
+        self._last_poll[repo] = now
+        self._next_poll[repo] = now + self._interval(rate)
+
+    def __contains__(self, repo):
+        return repo in self._rates
+
+    def remove(self, repo):
+        del self._rates[repo]
+        del self._last_poll[repo]
+        del self._next_poll[repo]
+        self._failures.pop(repo, None)
+
+    def _interval(self, rate):
+        if rate <= 0:
+            return self.max_interval
+        return min(self.max_interval, max(self.min_interval, 1 / rate))
+
+    def due(self):
+        """Return repos that should be polled now."""
+        now = self._now()
+        return [r for r, t in self._next_poll.items() if t <= now]
+
+    def polled(self, repo, num_updates):
+        """Record that a repo was polled and had `num_updates` updates."""
+        now = self._now()
+        elapsed = max(now - self._last_poll[repo], 1e-3)
+        rate = self.ALPHA * num_updates / elapsed + (1 - self.ALPHA) * self._rates[repo]
+        self._rates[repo] = rate
+        self._last_poll[repo] = now
+        self._next_poll[repo] = now + self._interval(rate)
+        self._failures.pop(repo, None)
+
+    def failed(self, repo):
+        """Record that polling a repo failed.
+
+        The repo is tried again after `min_interval` seconds, doubling with
+        every failure in a row up to `max_interval`.
+        """
+        failures = self._failures.get(repo, 0) + 1
+        self._failures[repo] = failures
+        backoff = self.min_interval * 2 ** (failures - 1)
+        self._next_poll[repo] = self._now() + min(self.max_interval, backoff)
+
+    def interval(self, repo):
+        return self._next_poll[repo] - self._last_poll[repo]
@@ -1,4 +1,5 @@
 import abc
+import pathlib
 import threading
 import time
 
@@ -9,6 +10,7 @@ import requests
 from yaml import safe_load as load_yaml
 
 from .data import Repository
+from .profiling import section
 
 
 class RepoLoader(abc.ABC):
@@ -16,7 +18,9 @@ class RepoLoader(abc.ABC):
     def __init__(self):
         self._done_callback = None
         self._repos = None
-        self._thread = threading.Thread(target=self._load_repos, daemon=True)
+        self._thread = threading.Thread(
+            target=self._load_repos, daemon=True, name="RepoLoader"
+        )
 
     def begin_loading(self, done_callback):
         self._done_callback = done_callback
@@ -26,7 +30,8 @@ class RepoLoader(abc.ABC):
     def load_repos(self) -> tuple[Repository]: ...
 
     def _load_repos(self):
-        self._repos = self.load_repos()
+        with section("load repos"):
+            self._repos = self.load_repos()
         self._done_callback(self._repos)
         self._done_callback = None
 
@@ -203,3 +208,45 @@ class VcsRepoLoader(RepoLoader):
             repos.append(Repository(name=name, owner=owner))
 
         return tuple(repos)
+
+
+ROS_PMC_REPOS = pathlib.Path(__file__).parent.resolve() / "ros_pmc_repos.txt"
+
+# A spec describes a repo loader as a tuple, so it can be sent to
+# another process.
+PRESETS = {
+    "user": [("user",)],
+    "gazebo": [
+        ("org", "gazebosim"),
+        ("org", "gazebo-tooling"),
+        ("org", "gazebo-release"),
+    ],
+    "rmf": [("org", "open-rmf")],
+    "infra": [
+        (
+            "vcs",
+            "https://raw.githubusercontent.com/ros-infrastructure/ci/refs/heads/main/ros-infrastructure.repos",
+        )
+    ],
+    "ros": [("file", str(ROS_PMC_REPOS))],
+}
+
+
+def make_repo_loader(specs, gql_client):
+    """Make a repo loader from a list of specs."""
+    loaders = []
+    for spec in specs:
+        match spec:
+            case ("user",):
+                loaders.append(CurrentUserRepoLoader(gql_client))
+            case ("org", organization):
+                loaders.append(OrgRepoLoader(organization, gql_client))
+            case ("file", path):
+                loaders.append(FileRepoLoader(pathlib.Path(path)))
+            case ("vcs", url):
+                loaders.append(VcsRepoLoader(url))
+            case _:
+                raise RuntimeError(f"Unknown repo loader spec {spec}")
+    if len(loaders) == 1:
+        return loaders[0]
+    return SequentialRepoLoaders(loaders)
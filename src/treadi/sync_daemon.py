@@ -0,0 +1,338 @@
+"""Share one set of loaders between TreadI instances on the same machine.
+
+The daemon listens on a Unix socket and owns one IssueCache and one
+IssueLoader. Each TreadI instance that connects subscribes to the repos it
+needs, and gets the issues in those repos. Repos that more than one
+instance subscribes to are only crawled and polled once. Dismissals are
+shared too: an issue dismissed in one instance is dismissed in all of them.
+
+Connections use the same messages as the loader worker process, see
+`treadi.loader_process`. The daemon starts itself the first time a
+TreadI instance needs it, and exits after being idle for a while.
+"""
+
+import logging
+import os
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from .data import Issue
+from .data import Repository
+from .data import issue_key
+from .loader_process import BatchSender
+from .loader_process import Channel
+from .loader_process import LoaderProcess
+
+
+def default_socket_path():
+    """Return the socket path in a directory only this user can use.
+
+    The directory is created if it doesn't exist yet.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        directory = os.path.join(runtime_dir, "treadi")
+    else:
+        directory = os.path.join(tempfile.gettempdir(), f"treadi-{os.getuid()}")
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    # Someone else may have made it first in a shared temporary directory
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f"{directory} must be a directory only you can access")
+    return os.path.join(directory, "sync.sock")
+
+
+def peer_uid(sock):
+    """Return the user ID of the process at the other end of a Unix socket.
+
+    Returns None where the platform can't tell.
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid
+
+
+class _LatestClient:
+    """Executes queries using the access token of the newest connection.
+
+    Access tokens expire, and every connection brings a fresh one.
+    """
+
+    def __init__(self, make_gql_client):
+        self._make_gql_client = make_gql_client
+        self._client = None
+        self._access_token = None
+
+    def set_access_token(self, access_token):
+        # Making a client parses the schema, so only do it for new tokens
+        if access_token != self._access_token:
+            self._client = self._make_gql_client(access_token)
+            self._access_token = access_token
+
+    def execute(self, *args, **kwargs):
+        return self._client.execute(*args, **kwargs)
+
+
+class SyncDaemon:
+
+    # Exit after this many seconds without any connections
+    IDLE_TIMEOUT = 10 * 60
+
+    def __init__(self, make_gql_client=None):
+        # These are imported here so clients don't need them to connect
+        from .issue_cache import IssueCache
+        from .issue_loader import IssueLoader
+
+        if make_gql_client is None:
+            from .client import make_gql_client
+        self._client = _LatestClient(make_gql_client)
+        self._cache = IssueCache()
+        self._loader = IssueLoader(self._client, (), self._cache, lambda p: None)
+        self._loader_started = False
+        # (repos, BatchSender) of every connection
+        self._subscribers = []
+        # BatchSender of a connection -> node IDs it watches
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._idle_since = time.monotonic()
+        self._logger = logging.getLogger("SyncDaemon")
+        self._cache.add_listener(self._on_cache_changed)
+
+    def serve(self, path):
+        if os.path.exists(path):
+            if _is_listening(path):
+                self._logger.info(f"Another daemon is listening on {path}")
+                return
+            # Left behind by a daemon that didn't exit cleanly
+            os.unlink(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Connections send access tokens, so only this user may connect.
+        # The umask makes the socket private from the moment it exists.
+        umask = os.umask(0o177)
+        try:
+            server.bind(path)
+        finally:
+            os.umask(umask)
+        server.listen()
+        server.settimeout(60)
+        self._logger.info(f"Listening on {path}")
+        try:
+            while True:
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    if self._idle_for() > self.IDLE_TIMEOUT:
+                        self._logger.info("Exiting after being idle")
+                        return
+                    continue
+                with self._lock:
+                    self._idle_since = None
+                threading.Thread(
+                    daemon=True,
+                    target=self.handle,
+                    args=(connection,),
+                    name="SyncConnection",
+                ).start()
+        finally:
+            server.close()
+            os.unlink(path)
+
+    def _idle_for(self):
+        with self._lock:
+            if self._idle_since is None:
+                return 0
+            return time.monotonic() - self._idle_since
+
+    def handle(self, connection):
+        """Serve one TreadI instance until it disconnects."""
+        from .repo_loader import make_repo_loader
+
+        channel = Channel(connection.makefile("rb"), connection.makefile("wb"))
+        sender = None
+        subscriber = None
+        try:
+            uid = peer_uid(connection)
+            if uid is not None and uid != os.getuid():
+                self._logger.warning(f"Refusing connection from user {uid}")
+                return
+            _, access_token, specs = channel.recv()
+            self._client.set_access_token(access_token)
+            repos = frozenset(make_repo_loader(specs, self._client).load_repos())
+            sender = BatchSender(channel)
+            sender.send(("repos", repos))
+            subscriber = (repos, sender)
+            # Subscribe before sending what's cached so no updates are missed
+            with self._lock:
+                self._subscribers.append(subscriber)
+            self._send_cached(repos, sender)
+            self._load_subscribed(sender.progress)
+            with self._lock:
+                if not self._loader_started:
+                    self._loader.start()
+                    self._loader_started = True
+            while True:
+                match channel.recv():
+                    case ("dismiss", (owner, name, number)):
+                        issue = Issue(
+                            repo=Repository(owner=owner, name=name), number=number
+                        )
+                        self._cache.dismiss(issue)
+                        self._broadcast_dismissal(issue)
+                    case ("watch", node_ids):
+                        self._watch(sender, node_ids)
+                    case ("set_specs", specs):
+                        new_repos = frozenset(
+                            make_repo_loader(specs, self._client).load_repos()
+                        )
+                        sender.send(("repos", new_repos))
+                        with self._lock:
+                            i = self._subscribers.index(subscriber)
+                            subscriber = self._subscribers[i] = (new_repos, sender)
+                        # The client dropped all of its issues, so it gets
+                        # the kept repos' issues again too. Removed repos stay
+                        # loaded only if another instance still wants them.
+                        self._send_cached(new_repos, sender)
+                        self._load_subscribed(sender.progress)
+                        repos = new_repos
+        except (EOFError, OSError):
+            pass
+        except Exception:
+            self._logger.exception("Exception serving TreadI instance")
+        finally:
+            if sender is not None:
+                sender.close()
+                self._watch(sender, ())
+            with self._lock:
+                if subscriber is not None:
+                    self._subscribers.remove(subscriber)
+                if not self._subscribers:
+                    self._idle_since = time.monotonic()
+            if subscriber is not None:
+                self._load_subscribed()
+            connection.close()
+
+    def _load_subscribed(self, progress_callback=None):
+        # Only repos some connection still wants are loaded and polled, which
+        # is what saves rate limit
+        with self._lock:
+            repos = dict.fromkeys(r for rs, _ in self._subscribers for r in rs)
+            self._loader.set_repos(repos, progress_callback)
+
+    def _watch(self, sender, node_ids):
+        # The loader refreshes what any connection watches
+        with self._lock:
+            if node_ids:
+                self._watched[sender] = node_ids
+            else:
+                self._watched.pop(sender, None)
+            watched = [i for ids in self._watched.values() for i in ids]
+        self._loader.set_watched(watched)
+
+    def _broadcast_dismissal(self, issue):
+        # The daemon's cache is shared, so a dismissal applies to every
+        # instance showing the issue, not only the one that dismissed it
+        with self._lock:
+            subscribers = tuple(self._subscribers)
+        for repos, sender in subscribers:
+            if issue.repo in repos:
+                try:
+                    sender.send(("dismissed", issue_key(issue)))
+                except OSError:
+                    # That connection's own thread cleans up after it
+                    pass
+
+    def _send_cached(self, repos, sender):
+        for r in repos:
+            sender.add(self._cache.most_recent_issues(n=sys.maxsize, repo=r))
+
+    def _on_cache_changed(self, issues):
+        with self._lock:
+            subscribers = tuple(self._subscribers)
+        for repos, sender in subscribers:
+            wanted = [i for i in issues if i.repo in repos]
+            if wanted:
+                sender.add(wanted)
+
+
+class SyncClient(LoaderProcess):
+    """Gets issues from the sync daemon, starting it if it isn't running.
+
+    This has the same interface as IssueLoader, so the UI can use either.
+    """
+
+    # Seconds to wait for a newly started daemon to listen
+    START_TIMEOUT = 10
+
+    def __init__(self, access_token, specs, cache, progress_callback, path=None):
+        super().__init__(access_token, specs, cache, progress_callback)
+        self._path = path or default_socket_path()
+        self._socket = None
+
+    def _connect(self):
+        try:
+            self._socket = self._open_socket()
+        except OSError:
+            self._logger.info("Starting sync daemon")
+            subprocess.Popen(
+                [sys.executable, "-m", "treadi.sync_daemon", self._path],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+            deadline = time.monotonic() + self.START_TIMEOUT
+            while True:
+                time.sleep(0.1)
+                try:
+                    self._socket = self._open_socket()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise
+        return Channel(self._socket.makefile("rb"), self._socket.makefile("wb"))
+
+    def _open_socket(self):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(self._path)
+        except OSError:
+            s.close()
+            raise
+        # Only send the access token to a daemon run by this user
+        uid = peer_uid(s)
+        if uid is None:
+            uid = os.stat(self._path).st_uid
+        if uid != os.getuid():
+            s.close()
+            raise RuntimeError(f"{self._path} is served by user {uid}")
+        return s
+
+
+def _is_listening(path):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+    except OSError:
+        return False
+    finally:
+        s.close()
+    return True
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    path = sys.argv[1] if len(sys.argv) > 1 else default_socket_path()
+    SyncDaemon().serve(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+from collections import OrderedDict
+
+
+class TextureCache:
+    """A least recently used cache of rendered text textures.
+
+    Keys are whatever identifies the rendered text, such as the issue,
+    the field of it that was rendered, and the label's size and font.
+    """
+
+    def __init__(self, capacity=512):
+        self.capacity = capacity
+        self._textures = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._textures)
+
+    def get(self, key):
+        texture = self._textures.get(key)
+        if texture is None:
+            self.misses += 1
+            return None
+        self._textures.move_to_end(key)
+        self.hits += 1
+        return texture
+
+    def put(self, key, texture):
+        if self.capacity <= 0:
+            return
+        self._textures[key] = texture
+        self._textures.move_to_end(key)
+        while len(self._textures) > self.capacity:
+            self._textures.popitem(last=False)
+
+    def clear(self):
+        self._textures.clear()
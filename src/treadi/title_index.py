@@ -0,0 +1,173 @@
+import bisect
+import re
+from collections import defaultdict
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def trigrams(token):
+    return {token[i : i + 3] for i in range(len(token) - 2)}
+
+
+class TitleIndex:
+    """An inverted index from the words in issue titles to issue keys.
+
+    Search terms match words exactly, as a prefix, or as a substring.
+    Substrings are found through an index of the trigrams in each word.
+    """
+
+    def __init__(self):
+        # Issue key -> tokens in its title
+        self._keys = {}
+        # Token -> set of issue keys with that token in the title
+        self._postings = {}
+        # All tokens in sorted order, for finding tokens by prefix
+        self._vocabulary = []
+        # Trigram -> set of tokens containing it
+        self._trigrams = defaultdict(set)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key, title):
+        self.remove(key)
+        tokens = frozenset(tokenize(title))
+        self._keys[key] = tokens
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                bisect.insort(self._vocabulary, token)
+                for trigram in trigrams(token):
+                    self._trigrams[trigram].add(token)
+            postings.add(key)
+
+    def remove(self, key):
+        tokens = self._keys.pop(key, None)
+        if tokens is None:
+            return
+        for token in tokens:
+            postings = self._postings[token]
+            postings.discard(key)
+            if postings:
+                continue
+            # Last title using this token is gone
+            del self._postings[token]
+            del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+            for trigram in trigrams(token):
+                trigram_tokens = self._trigrams[trigram]
+                trigram_tokens.discard(token)
+                if not trigram_tokens:
+                    del self._trigrams[trigram]
+
+    def _prefix_tokens(self, prefix):
+        i = bisect.bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            yield self._vocabulary[i]
+            i += 1
+
+    def _substring_tokens(self, term):
+        if len(term) < 3:
+            # Too short to use trigrams, so only prefixes match
+            return ()
+        candidates = None
+        for trigram in trigrams(term):
+            trigram_tokens = self._trigrams.get(trigram)
+            if not trigram_tokens:
+                return ()
+            if candidates is None:
+                candidates = set(trigram_tokens)
+            else:
+                candidates &= trigram_tokens
+        return [t for t in candidates if term in t]
+
+    def _postings_of(self, tokens):
+        return [self._postings[token] for token in tokens]
+
+    def match(self, query):
+        """Return the keys of titles matching every word in the query.
+
+        The result is a list of TitleMatch, best match first, that don't
+        overlap: titles where every word matched exactly, titles where every
+        word matched at least as a prefix, and titles with substring matches.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        exact = []
+        prefix = []
+        substring = []
+        for term in terms:
+            exact.append([self._postings[term]] if term in self._postings else [])
+            prefix_tokens = list(self._prefix_tokens(term))
+            prefix.append(self._postings_of(prefix_tokens))
+            substring.append(
+                self._postings_of(
+                    set(prefix_tokens).union(self._substring_tokens(term))
+                )
+            )
+        exact = TitleMatch(exact, self._keys, [_is(t) for t in terms])
+        prefix = TitleMatch(
+            prefix, self._keys, [_starts_with(t) for t in terms], exclude=[exact]
+        )
+        substring = TitleMatch(
+            substring,
+            self._keys,
+            [_contains(t) if len(t) >= 3 else _starts_with(t) for t in terms],
+            exclude=[exact, prefix],
+        )
+        return [exact, prefix, substring]
+
+
+def _is(term):
+    return lambda token: token == term
+
+
+def _starts_with(term):
+    return lambda token: token.startswith(term)
+
+
+def _contains(term):
+    return lambda token: term in token
+
+
+class TitleMatch:
+    """Keys matching every term of a query.
+
+    Common words can match most titles, so this avoids building the set of
+    matching keys unless asked to.
+    """
+
+    def __init__(self, term_postings, keys, term_tests, exclude=()):
+        # For each term, the posting sets of the tokens it matched
+        self._term_postings = term_postings
+        # Issue key -> tokens in its title
+        self._keys = keys
+        # For each term, whether a title token matches it
+        self._term_tests = term_tests
+        # Better matches that don't count as this match
+        self._exclude = exclude
+        # Upper bound on the number of matching keys
+        self.estimate = min(sum(len(p) for p in postings) for postings in term_postings)
+
+    def __contains__(self, key):
+        # Short terms can match many tokens, so this checks the title's own
+        # tokens instead of the posting set of every token a term matched
+        tokens = self._keys.get(key)
+        if tokens is None:
+            return False
+        for match in self._exclude:
+            if key in match:
+                return False
+        for test in self._term_tests:
+            if not any(test(t) for t in tokens):
+                return False
+        return True
+
+    def keys(self):
+        smallest = min(self._term_postings, key=lambda ps: sum(len(p) for p in ps))
+        return {k for p in smallest for k in p if k in self}
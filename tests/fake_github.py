@@ -0,0 +1,155 @@
+from gql.transport.exceptions import TransportQueryError
+from gql.transport.exceptions import TransportServerError
+from dateutil.parser import isoparse
+from graphql import print_ast
+
+
+def make_node(
+    repo, number, *, updated_at="2006-07-04T15:00:00Z", is_pr=False, closed=False
+):
+    return {
+        "__typename": "PullRequest" if is_pr else "Issue",
+        "id": node_id(repo, number),
+        "closed": closed,
+        "author": {"login": "sloretz"},
+        "createdAt": "2006-07-04T15:00:00Z",
+        "number": number,
+        "title": f"Issue {number}",
+        "updatedAt": updated_at,
+        "url": f"https://github.com/{repo.owner}/{repo.name}/issues/{number}",
+        "isReadByViewer": False,
+        "repository": {"name": repo.name, "owner": {"login": repo.owner}},
+    }
+
+
+def node_id(repo, number):
+    return f"{repo.owner}/{repo.name}#{number}"
+
+
+class FakeGithub:
+    """Answers the queries made by IssueLoader.
+
+    `repos` maps a Repository to a tuple of (number of issues, number of PRs)
+    returned by the initial crawl. `updates` is a list of issue and PR nodes
+    returned by searches, and by nodes queries in place of what was crawled.
+    """
+
+    def __init__(self, repos, *, broken_repos=(), flaky_calls=0):
+        self.repos = repos
+        self.updates = []
+        self.broken_repos = set(broken_repos)
+        # Number of calls that fail with a server error before succeeding
+        self.flaky_calls = flaky_calls
+        self.calls = []
+
+    def execute(self, request):
+        # gql() returns a DocumentNode in gql 3, and a GraphQLRequest in gql 4
+        document = getattr(request, "document", request)
+        self.calls.append(print_ast(document))
+        if self.flaky_calls > 0:
+            self.flaky_calls -= 1
+            raise TransportServerError("502 Bad Gateway", 502)
+        result = {}
+        errors = []
+        for selection in document.definitions[0].selection_set.selections:
+            if selection.name.value == "search":
+                result["search"] = self._search(selection)
+                continue
+            if selection.name.value == "nodes":
+                result["nodes"] = self._nodes(selection, errors)
+                continue
+            args = {a.name.value: a.value.value for a in selection.arguments}
+            repo = next(
+                r
+                for r in self.repos
+                if r.owner == args["owner"] and r.name == args["name"]
+            )
+            if repo in self.broken_repos:
+                raise TransportQueryError(f"Could not resolve {repo}")
+            num_issues, num_prs = self.repos[repo]
+            repo_result = {}
+            for connection in selection.selection_set.selections:
+                kind = connection.name.value
+                total = num_issues if kind == "issues" else num_prs
+                # PR numbers come after issue numbers
+                offset = 0 if kind == "issues" else num_issues
+                conn_args = {a.name.value: a.value for a in connection.arguments}
+                if "first" not in conn_args:
+                    # Only counting
+                    repo_result[kind] = {"totalCount": total}
+                    continue
+                first = int(conn_args["first"].value)
+                start = int(conn_args["after"].value) if "after" in conn_args else 0
+                end = min(start + first, total)
+                repo_result[kind] = {
+                    "nodes": [
+                        make_node(repo, offset + n + 1, is_pr=kind != "issues")
+                        for n in range(start, end)
+                    ],
+                    "pageInfo": {"endCursor": str(end), "hasNextPage": end < total},
+                    "totalCount": total,
+                }
+            result[selection.alias.value] = repo_result
+        if errors:
+            raise TransportQueryError(str(errors[0]), errors=errors, data=result)
+        return result
+
+    def _nodes(self, selection, errors):
+        (ids,) = [a.value for a in selection.arguments if a.name.value == "ids"]
+        nodes = []
+        for i in ids.values:
+            updated = [n for n in self.updates if n["id"] == i.value]
+            if updated:
+                nodes.append(updated[-1])
+                continue
+            repo_name, number = i.value.split("#")
+            owner, name = repo_name.split("/")
+            repo = next(
+                (r for r in self.repos if r.owner == owner and r.name == name), None
+            )
+            number = int(number)
+            if repo is None or number > sum(self.repos[repo]):
+                # Github returns null along with an error for IDs that don't
+                # resolve
+                errors.append(
+                    {
+                        "type": "NOT_FOUND",
+                        "path": ["nodes", len(nodes)],
+                        "message": "Could not resolve to a node with the global "
+                        f"id of '{i.value}'",
+                    }
+                )
+                nodes.append(None)
+                continue
+            nodes.append(make_node(repo, number, is_pr=number > self.repos[repo][0]))
+        return nodes
+
+    def _search(self, selection):
+        args = {a.name.value: a.value.value for a in selection.arguments}
+        repos = set()
+        nodes = self.updates
+        for qualifier in args["query"].split():
+            match qualifier.split(":", 1):
+                case ["repo", full_name]:
+                    repos.add(tuple(full_name.split("/")))
+                case ["is", "issue"]:
+                    nodes = [n for n in nodes if n["__typename"] == "Issue"]
+                case ["is", "pr"]:
+                    nodes = [n for n in nodes if n["__typename"] == "PullRequest"]
+                case ["is", "open"]:
+                    nodes = [n for n in nodes if not n["closed"]]
+                case ["updated", since]:
+                    since = isoparse(since.lstrip(">"))
+                    nodes = [n for n in nodes if isoparse(n["updatedAt"]) > since]
+        nodes = [
+            n
+            for n in nodes
+            if (n["repository"]["owner"]["login"], n["repository"]["name"]) in repos
+        ]
+        first = int(args["first"])
+        start = int(args.get("after", 0))
+        end = min(start + first, len(nodes))
+        return {
+            "nodes": nodes[start:end],
+            "pageInfo": {"endCursor": str(end), "hasNextPage": end < len(nodes)},
+        }
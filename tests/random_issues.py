@@ -0,0 +1,37 @@
+"""Random issues for tests that don't care about most of their fields."""
+
+import random
+
+from dateutil.parser import isoparse
+
+from treadi.data import Issue
+from treadi.data import Repository
+
+
+def random_string(*, len=5):
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    numbers = "0123456789"
+    symbols = "_-"
+    return "".join(
+        random.sample(alphabet + alphabet.upper() + numbers + symbols, k=len)
+    )
+
+
+def rand_repo():
+    return Repository(owner=random_string(), name=random_string())
+
+
+def rand_issue(*, updated_at, repo=None, is_read=False, is_pr=False, author=None):
+    if repo is None:
+        repo = rand_repo()
+    return Issue(
+        repo=repo,
+        author=random_string() if author is None else author,
+        created_at=isoparse("2006-07-04T15:00:00Z"),
+        updated_at=isoparse(updated_at),
+        number=random.randint(1, 9999),
+        title=random_string(),
+        url=random_string(),
+        is_read=is_read,
+        is_pr=is_pr,
+    )
@@ -0,0 +1,84 @@
+import argparse
+import random
+
+import pytest
+from dateutil.parser import isoparse
+
+from treadi import headless
+from treadi.data import Repository
+from treadi.issue_cache import IssueCache
+
+from .random_issues import rand_issue
+
+np = pytest.importorskip("numpy")
+
+from treadi.columns import ColumnStore
+from treadi.columns import WeightedScore
+
+NOW = isoparse("2006-07-05T00:00:00Z").timestamp()
+
+
+def test_top_matches_sorting():
+    store = ColumnStore(capacity=4)
+    issues = [
+        rand_issue(updated_at=f"2006-07-04T{h:02}:{m:02}:00Z")
+        for h in range(24)
+        for m in range(0, 60, 7)
+    ]
+    random.shuffle(issues)
+    for issue in issues:
+        store.add(issue)
+    for issue in issues[:50]:
+        store.remove(issue)
+    remaining = sorted(issues[50:], key=lambda i: i.updated_at, reverse=True)
+    score = WeightedScore(now=lambda: NOW)
+    assert remaining[:10] == store.top(10, score)
+    assert remaining == store.top(len(issues), score)
+
+
+def test_weighted_score():
+    store = ColumnStore()
+    favorite = Repository(owner="ros2", name="rclpy")
+    older_favorite = rand_issue(updated_at="2006-07-04T12:00:00Z", repo=favorite)
+    newer = rand_issue(updated_at="2006-07-04T20:00:00Z", is_read=True)
+    older_unread = rand_issue(updated_at="2006-07-04T18:00:00Z")
+    for issue in (older_favorite, newer, older_unread):
+        store.add(issue)
+    hour = 60 * 60
+    score = WeightedScore(
+        time_scale=hour,
+        repo_weights={favorite: 10},
+        unread_weight=3,
+        now=lambda: NOW,
+    )
+    assert [older_favorite, older_unread, newer] == store.top(3, score)
+
+
+def test_cache_top_ranked():
+    score = WeightedScore(pr_weight=100, now=lambda: NOW)
+    cache = IssueCache(ranking=score)
+    issue = rand_issue(updated_at="2006-07-04T20:00:00Z")
+    pr = rand_issue(updated_at="2006-07-04T12:00:00Z", is_pr=True)
+    cache.insert_many([issue, pr])
+    assert [pr, issue] == cache.top_ranked(2)
+    cache.dismiss(pr)
+    assert [issue] == cache.top_ranked(2)
+
+
+def test_headless_ranking():
+    args = argparse.Namespace(
+        favorite_repo=["ros2/rclpy"],
+        favorite_author=[],
+        favorite_weight=1.0,
+        pr_weight=0.0,
+        unread_weight=0.0,
+    )
+    cache = IssueCache(ranking=headless.make_ranking(args))
+    favorite = rand_issue(
+        updated_at="2006-07-04T12:00:00Z", repo=Repository(owner="ros2", name="rclpy")
+    )
+    newer = rand_issue(updated_at="2006-07-04T20:00:00Z")
+    cache.insert_many([favorite, newer])
+    assert [favorite, newer] == cache.top_ranked(2)
+    args.favorite_repo = []
+    assert headless.make_ranking(args) is None
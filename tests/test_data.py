@@ -0,0 +1,38 @@
+from dateutil.parser import isoparse
+
+from treadi.data import Issue
+from treadi.data import Repository
+from treadi.data import issue_from_dict
+from treadi.data import issue_from_record
+from treadi.data import issue_to_dict
+from treadi.data import issue_to_record
+
+
+def test_issue_dict_round_trip():
+    issue = Issue(
+        repo=Repository(owner="ros2", name="rclpy"),
+        author="sloretz",
+        created_at=isoparse("2006-07-04T15:00:00Z"),
+        updated_at=isoparse("2006-07-04T16:00:00Z"),
+        number=1234,
+        title="Fix all the bugs",
+        url="https://github.com/ros2/rclpy/issues/1234",
+        is_read=True,
+    )
+    assert issue == issue_from_dict(issue_to_dict(issue))
+
+
+def test_issue_record_round_trip():
+    issue = Issue(
+        repo=Repository(owner="ros2", name="rclpy"),
+        author="sloretz",
+        created_at=isoparse("2006-07-04T15:00:00Z"),
+        updated_at=isoparse("2006-07-04T16:00:00.123Z"),
+        number=1234,
+        title="Fix all the bugs",
+        url="https://github.com/ros2/rclpy/pull/1234",
+        is_read=False,
+        is_pr=True,
+        node_id="PR_kwDOAAAAAA",
+    )
+    assert issue == issue_from_record(issue_to_record(issue))
@@ -0,0 +1,47 @@
+import threading
+
+from treadi import frame_timing
+from treadi import profiling
+
+
+def test_long_frames_tagged_with_background_work(monkeypatch):
+    now = [0.0]
+    timer = frame_timing.FrameTimer(long_frame=0.05, clock=lambda: now[0])
+    monkeypatch.setattr(profiling, "_observers", (timer,))
+
+    entered = threading.Event()
+    release = threading.Event()
+
+    def load():
+        with profiling.section("execute"):
+            entered.set()
+            release.wait()
+
+    timer.tick()
+    # A quick idle frame
+    now[0] += 0.01
+    assert timer.tick() is None
+
+    # A long frame while the loader executes a batch
+    thread = threading.Thread(target=load)
+    thread.start()
+    entered.wait()
+    with profiling.section("dismiss"):
+        now[0] += 0.2
+    frame = timer.tick()
+    assert frame.duration == 0.2
+    assert frame.background == ("execute",)
+    assert set(frame.ran) == {"dismiss"}
+
+    # The batch is still executing during the next frame
+    release.set()
+    thread.join()
+    now[0] += 0.01
+    assert timer.tick() is None
+
+    assert sum(timer.histograms[()]) == 1
+    assert timer.histograms[("execute",)][0] == 1
+    assert timer.histograms[("execute",)][4] == 1
+    assert list(timer.long_frames) == [frame]
+    assert "execute" in timer.summary()
+    assert "ran: dismiss" in frame_timing.describe(frame)
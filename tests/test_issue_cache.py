@@ -1,39 +1,14 @@
 import copy
 import random
 
+import pytest
 from dateutil.parser import isoparse
 
-from treadi.data import Issue
-from treadi.data import Repository
+from treadi.data import issue_key
 from treadi.issue_cache import IssueCache
 
-
-def random_string(*, len=5):
-    alphabet = "abcdefghijklmnopqrstuvwxyz"
-    numbers = "0123456789"
-    symbols = "_-"
-    return "".join(
-        random.sample(alphabet + alphabet.upper() + numbers + symbols, k=len)
-    )
-
-
-def rand_repo():
-    return Repository(owner=random_string(), name=random_string())
-
-
-def rand_issue(*, updated_at, repo=None, is_read=False):
-    if repo is None:
-        repo = rand_repo()
-    return Issue(
-        repo=repo,
-        author=random_string(),
-        created_at=isoparse("2006-07-04T15:00:00Z"),
-        updated_at=isoparse(updated_at),
-        number=random.randint(1, 9999),
-        title=random_string(),
-        url=random_string(),
-        is_read=is_read,
-    )
+from .random_issues import rand_issue
+from .random_issues import rand_repo
 
 
 def test_cache_sorted():
@@ -95,3 +70,265 @@ def test_cache_update_dismissed_is_read():
     issue.is_read = True
     cache.insert(issue)
     assert [] == cache.most_recent_issues(1)
+
+
+def test_cache_listener():
+    cache = IssueCache()
+    changes = []
+    cache.add_listener(changes.append)
+    issue = rand_issue(updated_at="2006-07-04T15:00:00Z")
+    cache.insert(issue)
+    assert [[issue]] == changes
+    # Inserting the same data again is not a change
+    cache.insert(issue)
+    assert [[issue]] == changes
+    cache.dismiss(issue)
+    assert [[issue], [issue]] == changes
+    cache.remove_listener(changes.append)
+    cache.insert(rand_issue(updated_at="2006-07-04T16:00:00Z"))
+    assert 2 == len(changes)
+
+
+def test_cache_filtered():
+    cache = IssueCache()
+    repo = rand_repo()
+    first = rand_issue(updated_at="2006-07-04T15:00:00Z", repo=repo, is_pr=True)
+    second = rand_issue(updated_at="2006-07-04T16:00:00Z", author="sloretz")
+    third = rand_issue(updated_at="2006-07-04T17:00:00Z", repo=repo, is_read=True)
+    fourth = rand_issue(updated_at="2006-07-04T18:00:00Z", author="sloretz")
+    for i in (first, second, third, fourth):
+        cache.insert(i)
+    assert [third, first] == cache.most_recent_issues(3, repo=repo)
+    assert [fourth, second] == cache.most_recent_issues(3, author="sloretz")
+    assert [first] == cache.most_recent_issues(3, is_pr=True)
+    assert [fourth, third, second] == cache.most_recent_issues(3, is_pr=False)
+    assert [fourth, second, first] == cache.most_recent_issues(3, unread=True)
+    assert [third] == cache.most_recent_issues(3, unread=False)
+    assert [first] == cache.most_recent_issues(3, repo=repo, unread=True)
+    assert [] == cache.most_recent_issues(3, repo=rand_repo())
+
+
+def test_cache_filtered_after_update():
+    cache = IssueCache()
+    repo = rand_repo()
+    issue = rand_issue(updated_at="2006-07-04T15:00:00Z", repo=repo)
+    cache.insert(issue)
+    issue = copy.deepcopy(issue)
+    issue.updated_at = isoparse("2006-07-04T16:00:00Z")
+    issue.is_read = True
+    cache.insert(issue)
+    assert [issue] == cache.most_recent_issues(3, repo=repo)
+    assert [] == cache.most_recent_issues(3, unread=True)
+    cache.dismiss(issue)
+    assert [] == cache.most_recent_issues(3, repo=repo)
+
+
+def test_cache_sorted_many():
+    cache = IssueCache()
+    issues = [
+        rand_issue(updated_at=f"2006-07-04T{h:02}:{m:02}:00Z")
+        for h in range(24)
+        for m in range(60)
+    ]
+    random.shuffle(issues)
+    for i in issues:
+        cache.insert(i)
+    for i in issues[::3]:
+        cache.dismiss(i)
+    remaining = [i for i in issues if i not in issues[::3]]
+    remaining.sort(reverse=True, key=lambda i: i.updated_at)
+    assert remaining[:100] == cache.most_recent_issues(100)
+    assert remaining == cache.most_recent_issues(len(issues))
+
+
+def test_cache_set_read_states():
+    cache = IssueCache()
+    changes = []
+    first = rand_issue(updated_at="2006-07-04T15:00:00Z")
+    second = rand_issue(updated_at="2006-07-04T16:00:00Z")
+    third = rand_issue(updated_at="2006-07-04T17:00:00Z")
+    for i in (first, second, third):
+        cache.insert(i)
+    cache.dismiss(third)
+    cache.add_listener(changes.append)
+    assert 2 == cache.set_read_states(
+        {
+            issue_key(first): True,
+            issue_key(second): False,
+            issue_key(third): True,
+            ("not", "cached", 1): True,
+        }
+    )
+    assert [second] == cache.most_recent_issues(3, unread=True)
+    assert [issue_key(second), issue_key(first)] == [
+        issue_key(i) for i in cache.most_recent_issues(3)
+    ]
+    assert cache.most_recent_issues(3)[1].is_read
+    # Only changes to the upcomming list are notified
+    assert 1 == len(changes)
+    assert issue_key(first) == issue_key(changes[0][0])
+
+
+def test_cache_search():
+    cache = IssueCache()
+    first = rand_issue(updated_at="2006-07-04T15:00:00Z")
+    first.title = "Fix the build"
+    second = rand_issue(updated_at="2006-07-04T16:00:00Z")
+    second.title = "Fixing flaky tests"
+    third = rand_issue(updated_at="2006-07-04T17:00:00Z")
+    third.title = "Fix crash on shutdown"
+    for i in (first, second, third):
+        cache.insert(i)
+    # Exact word matches first, then prefixes, each most recent first
+    assert [third, first, second] == cache.search("fix", 5)
+    assert [third] == cache.search("fix shut", 5)
+    cache.dismiss(third)
+    assert [first, second] == cache.search("fix", 5)
+    assert [] == cache.search("shutdown", 5)
+
+
+def test_cache_insert_many():
+    cache = IssueCache()
+    changes = []
+    cache.add_listener(changes.append)
+    first = rand_issue(updated_at="2006-07-04T15:00:00Z")
+    second = rand_issue(updated_at="2006-07-04T16:00:00Z")
+    cache.insert_many([first, second, first])
+    assert [second, first] == cache.most_recent_issues(3)
+    assert [[first, second]] == changes
+
+
+def test_cache_max_upcomming():
+    cache = IssueCache(max_upcomming=3)
+    issues = [rand_issue(updated_at=f"2006-07-04T{h:02}:00:00Z") for h in range(10, 20)]
+    shuffled = list(issues)
+    random.shuffle(shuffled)
+    for i in shuffled:
+        cache.insert(i)
+    newest = issues[::-1]
+    assert newest[:3] == cache.most_recent_issues(10)
+    # Dismissing makes room, so the newest evicted issue comes back
+    changes = []
+    cache.add_listener(changes.append)
+    cache.dismiss(newest[0])
+    assert newest[1:4] == cache.most_recent_issues(10)
+    assert [[newest[0], newest[3]]] == changes
+    # Only as many evicted issues as fit in the cache are kept to come back
+    for i in newest[1:4]:
+        cache.dismiss(i)
+    assert newest[4:6] == cache.most_recent_issues(10)
+
+
+def test_cache_max_upcomming_at_least_one():
+    with pytest.raises(ValueError):
+        IssueCache(max_upcomming=0)
+
+
+def test_cache_tombstones_capped(monkeypatch):
+    monkeypatch.setattr(IssueCache, "MAX_TOMBSTONES", 3)
+    cache = IssueCache(max_upcomming=1)
+    issues = [rand_issue(updated_at=f"2006-07-04T{h:02}:00:00Z") for h in range(10, 20)]
+    cache.insert_many(reversed(issues))
+    assert 3 == len(cache._IssueCache__tombstones)
+
+
+def test_cache_closed_unknown_no_tombstone():
+    cache = IssueCache()
+    issue = rand_issue(updated_at="2006-07-04T16:00:00Z")
+    issue.is_closed = True
+    cache.insert_many([issue])
+    assert not cache._IssueCache__tombstones
+
+
+def test_cache_evicted_resurfaces():
+    cache = IssueCache(max_upcomming=2)
+    old = rand_issue(updated_at="2006-07-04T15:00:00Z")
+    cache.insert(old)
+    cache.insert(rand_issue(updated_at="2006-07-04T16:00:00Z"))
+    cache.insert(rand_issue(updated_at="2006-07-04T17:00:00Z"))
+    assert old not in cache.most_recent_issues(3)
+    # Stale data for an evicted issue is ignored
+    cache.insert(old)
+    assert old not in cache.most_recent_issues(3)
+    # New activity brings it back
+    updated = copy.deepcopy(old)
+    updated.updated_at = isoparse("2006-07-04T18:00:00Z")
+    cache.insert(updated)
+    assert updated == cache.most_recent_issues(1)[0]
+
+
+def test_cache_insert_evicted_immediately():
+    cache = IssueCache(max_upcomming=1)
+    changes = []
+    cache.add_listener(changes.append)
+    new = rand_issue(updated_at="2006-07-04T16:00:00Z")
+    cache.insert(new)
+    cache.insert(rand_issue(updated_at="2006-07-04T15:00:00Z"))
+    assert [new] == cache.most_recent_issues(3)
+    assert [[new]] == changes
+
+
+def test_cache_closed_removed():
+    cache = IssueCache()
+    changed = []
+    cache.add_listener(changed.extend)
+    issue = rand_issue(updated_at="2006-07-04T15:00:00Z")
+    dismissed = rand_issue(updated_at="2006-07-04T16:00:00Z")
+    cache.insert_many([issue, dismissed])
+    cache.dismiss(dismissed)
+    changed.clear()
+
+    closed = copy.copy(issue)
+    closed.updated_at = isoparse("2006-07-04T17:00:00Z")
+    closed.is_closed = True
+    dismissed_closed = copy.copy(dismissed)
+    dismissed_closed.updated_at = isoparse("2006-07-04T17:00:00Z")
+    dismissed_closed.is_closed = True
+    cache.insert_many([closed, dismissed_closed])
+    assert [] == cache.most_recent_issues(5)
+    assert [closed] == changed
+    assert [] == cache.search(issue.title)
+
+    # Stale data from before it was closed doesn't bring it back
+    cache.insert(issue)
+    assert [] == cache.most_recent_issues(5)
+
+    # Reopening it does
+    reopened = copy.copy(issue)
+    reopened.updated_at = isoparse("2006-07-04T18:00:00Z")
+    cache.insert(reopened)
+    assert [reopened] == cache.most_recent_issues(5)
+
+
+def test_cache_closed_before_newer_data():
+    cache = IssueCache()
+    issue = rand_issue(updated_at="2006-07-04T16:00:00Z")
+    cache.insert(issue)
+    closed = copy.copy(issue)
+    closed.updated_at = isoparse("2006-07-04T15:00:00Z")
+    closed.is_closed = True
+    cache.insert(closed)
+    assert [issue] == cache.most_recent_issues(5)
+
+
+def test_cache_remove_repos():
+    cache = IssueCache()
+    kept_repo = rand_repo()
+    removed_repo = rand_repo()
+    kept = rand_issue(updated_at="2006-07-04T15:00:00Z", repo=kept_repo)
+    removed = rand_issue(updated_at="2006-07-04T16:00:00Z", repo=removed_repo)
+    dismissed = rand_issue(updated_at="2006-07-04T17:00:00Z", repo=removed_repo)
+    cache.insert_many([kept, removed, dismissed])
+    cache.dismiss(dismissed)
+    changed = []
+    cache.add_listener(changed.extend)
+
+    cache.remove_repos([removed_repo])
+    assert [removed] == changed
+    assert [kept] == cache.most_recent_issues(5)
+    assert [] == cache.most_recent_issues(5, repo=removed_repo)
+    assert cache.newest_update_time(repo=removed_repo) is None
+
+    # Loading the repo again doesn't bring back dismissed issues
+    cache.insert_many([removed, dismissed])
+    assert [removed, kept] == cache.most_recent_issues(5)
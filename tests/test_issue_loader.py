@@ -0,0 +1,341 @@
+from datetime import datetime
+from datetime import timezone
+
+from dateutil.parser import isoparse
+
+from treadi.data import Repository
+from treadi.issue_cache import IssueCache
+from treadi.issue_loader import IssueLoader
+from treadi.issue_loader import _make_issue
+
+from .fake_github import FakeGithub
+from .fake_github import make_node
+from .fake_github import node_id
+
+
+def make_loader(github, repos):
+    progress = []
+    cache = IssueCache()
+    loader = IssueLoader(github, repos, cache, progress.append)
+    loader.BACKOFF = 0
+    return loader, cache, progress
+
+
+def test_load_all_issues():
+    repos = {
+        Repository(owner="ros2", name=f"repo{i}"): (i * 50, i * 30) for i in range(5)
+    }
+    github = FakeGithub(repos)
+    loader, cache, progress = make_loader(github, repos)
+    loader.BATCH_UNITS = 2
+    loader._load_all_issues(progress_callback=progress.append)
+    assert 1.0 == progress[-1]
+    assert sum(i + p for i, p in repos.values()) == len(cache.most_recent_issues(1000))
+
+
+def test_load_all_issues_retries_flaky_batch():
+    repos = {Repository(owner="ros2", name="rclpy"): (10, 10)}
+    github = FakeGithub(repos, flaky_calls=2)
+    loader, cache, progress = make_loader(github, repos)
+    loader._load_all_issues(progress_callback=progress.append)
+    assert 1.0 == progress[-1]
+    assert 20 == len(cache.most_recent_issues(1000))
+    assert [] == loader._failed_repos
+
+
+def test_load_all_issues_isolates_broken_repo():
+    repos = {Repository(owner="ros2", name=f"repo{i}"): (10, 10) for i in range(8)}
+    broken = Repository(owner="ros2", name="repo5")
+    github = FakeGithub(repos, broken_repos=[broken])
+    loader, cache, progress = make_loader(github, repos)
+    loader._load_all_issues(progress_callback=progress.append)
+    assert 1.0 == progress[-1]
+    assert [broken] == loader._failed_repos
+    assert 7 * 20 == len(cache.most_recent_issues(1000))
+
+
+def test_load_all_issues_resumes_from_checkpoint():
+    repos = {Repository(owner="ros2", name="rclpy"): (250, 0)}
+    github = FakeGithub(repos)
+    loader, cache, progress = make_loader(github, repos)
+
+    def interrupt(progress):
+        raise KeyboardInterrupt
+
+    # Interrupt the crawl after the first page
+    try:
+        loader._load_all_issues(progress_callback=interrupt)
+    except KeyboardInterrupt:
+        pass
+    assert 100 == len(cache.most_recent_issues(1000))
+
+    loader._load_all_issues(progress_callback=progress.append)
+    assert 1.0 == progress[-1]
+    assert 250 == len(cache.most_recent_issues(1000))
+    # Only the remaining two pages were fetched after resuming
+    assert 3 == sum("issues(first" in c for c in github.calls)
+
+
+def test_load_all_issues_keeps_units_when_processing_fails():
+    repos = {Repository(owner="ros2", name=f"repo{i}"): (10, 10) for i in range(3)}
+    github = FakeGithub(repos)
+    loader, cache, progress = make_loader(github, repos)
+    inserts = []
+
+    def fail_once(issues):
+        inserts.append(issues)
+        if len(inserts) == 2:
+            raise RuntimeError("Listener failed")
+
+    cache.add_listener(fail_once)
+    try:
+        loader._load_all_issues(progress_callback=progress.append)
+    except RuntimeError:
+        pass
+    # Only the first unit was handled before the failure
+    assert 5 == len(loader._queue)
+
+    loader._load_all_issues(progress_callback=progress.append)
+    assert 1.0 == progress[-1]
+    assert 60 == len(cache.most_recent_issues(1000))
+
+
+def test_load_all_issues_packs_batches_by_cost():
+    big = Repository(owner="ros2", name="ros2")
+    repos = {big: (250, 0)}
+    repos.update({Repository(owner="ros2", name=f"tiny{i}"): (1, 0) for i in range(30)})
+    github = FakeGithub(repos)
+    loader, cache, progress = make_loader(github, repos)
+    loader._load_all_issues(progress_callback=progress.append)
+    assert 280 == len(cache.most_recent_issues(1000))
+    assert 1.0 == progress[-1]
+    assert progress == sorted(progress)
+    # One query counts issues, then repos without PRs aren't asked for PRs
+    assert "totalCount" in github.calls[0]
+    assert all("pullRequests(first" not in c for c in github.calls)
+    # The big repo's three pages share batches with the tiny repos
+    assert 4 == len(github.calls)
+
+
+def test_update_due_repos_uses_per_repo_watermarks():
+    busy = Repository(owner="ros2", name="rclpy")
+    quiet = Repository(owner="ros2", name="rclcpp")
+    repos = {busy: (1, 0), quiet: (1, 0)}
+    github = FakeGithub(repos)
+    loader, cache, progress = make_loader(github, repos)
+    loader._load_all_issues()
+    loader._crawl_started = {r: isoparse("2006-07-04T00:00:00Z") for r in repos}
+    # The crawl found issues updated at 2006-07-04T15:00:00Z in both repos
+    cache.insert(_make_issue(make_node(busy, 2, updated_at="2006-07-05T00:00:00Z")))
+    github.updates = [
+        # Already known, but within the overlap of busy's watermark
+        make_node(busy, 2, updated_at="2006-07-05T00:00:00Z"),
+        make_node(busy, 3, updated_at="2006-07-05T01:00:00Z"),
+        # Newer than quiet's watermark, but older than busy's
+        make_node(quiet, 4, updated_at="2006-07-04T18:00:00Z"),
+        make_node(quiet, 5, updated_at="2006-07-04T19:00:00Z", is_pr=True),
+    ]
+    loader._schedule_repos(repos)
+    loader._scheduler._next_poll = {r: 0 for r in repos}
+    loader._update_due_repos()
+    numbers = {i.number for i in cache.most_recent_issues(10)}
+    assert {1, 2, 3, 4, 5} == numbers
+    assert isoparse("2006-07-05T01:00:00Z") == cache.newest_update_time(repo=busy)
+    assert isoparse("2006-07-04T19:00:00Z") == cache.newest_update_time(repo=quiet)
+
+
+def test_update_due_repos_removes_closed():
+    repo = Repository(owner="ros2", name="rclpy")
+    repos = {repo: (2, 1)}
+    github = FakeGithub(repos)
+    loader, cache, progress = make_loader(github, repos)
+    loader._load_all_issues()
+    loader._crawl_started = {repo: isoparse("2006-07-04T00:00:00Z")}
+    assert {1, 2, 3} == {i.number for i in cache.most_recent_issues(10)}
+    github.updates = [
+        make_node(repo, 1, updated_at="2006-07-05T00:00:00Z", closed=True),
+        # A merged PR
+        make_node(repo, 3, updated_at="2006-07-05T00:00:00Z", is_pr=True, closed=True),
+    ]
+    loader._schedule_repos(repos)
+    loader._scheduler._next_poll = {repo: 0}
+    loader._update_due_repos()
+    assert [2] == [i.number for i in cache.most_recent_issues(10)]
+    assert all("is:open" not in call for call in github.calls)
+
+
+def test_watermark_starts_at_crawl():
+    repo = Repository(owner="ros2", name="rclpy")
+    repos = {repo: (1, 0)}
+    github = FakeGithub(repos)
+    loader, cache, progress = make_loader(github, repos)
+    loader._load_all_issues()
+    # The only open issue is from 2006, but the crawl ran much later
+    loader._crawl_started = {repo: isoparse("2010-01-01T00:00:00Z")}
+    github.updates = [
+        make_node(repo, n, updated_at="2008-01-01T00:00:00Z", is_pr=True, closed=True)
+        for n in range(2, 452)
+    ]
+    github.updates.append(make_node(repo, 1, updated_at="2010-01-02T00:00:00Z"))
+    loader._schedule_repos(repos)
+    loader._scheduler._next_poll = {repo: 0}
+    github.calls.clear()
+    loader._update_due_repos()
+    # What was merged before the crawl isn't paged through again
+    assert 2 == len(github.calls)
+    assert isoparse("2010-01-02T00:00:00Z") == cache.newest_update_time(repo=repo)
+
+    # Repos added later are searched from when their own crawl started
+    new_repo = Repository(owner="ros2", name="rclcpp")
+    github.repos[new_repo] = (0, 0)
+    loader.add_repos([new_repo])
+    loader._change_repos()
+    assert loader._crawl_started[new_repo] > loader._crawl_started[repo]
+    assert loader._crawl_started[new_repo] == loader._watermark(new_repo)
+
+
+def test_search_chunks_respect_query_length():
+    repos = {Repository(owner="ros2", name=f"repository{i}"): (0, 0) for i in range(50)}
+    loader, cache, progress = make_loader(FakeGithub(repos), repos)
+    chunks = list(loader._search_chunks(list(repos)))
+    assert list(repos) == [r for chunk in chunks for r in chunk]
+    for chunk in chunks:
+        qualifiers = " ".join(f"repo:{r.owner}/{r.name}" for r in chunk)
+        assert len(qualifiers) <= loader.SEARCH_QUERY_LENGTH - 64
+
+
+def test_set_repos_only_crawls_new_repos():
+    rclpy = Repository(owner="ros2", name="rclpy")
+    rclcpp = Repository(owner="ros2", name="rclcpp")
+    gz_sim = Repository(owner="gazebosim", name="gz-sim")
+    repos = {rclpy: (3, 1), rclcpp: (2, 0), gz_sim: (4, 2)}
+    github = FakeGithub(repos)
+    loader, cache, progress = make_loader(github, [rclpy, rclcpp])
+    loader._load_all_issues()
+    loader._schedule_repos([rclpy, rclcpp])
+    github.calls.clear()
+
+    loader.set_repos([rclpy, gz_sim], progress.append)
+    loader._change_repos()
+    assert 1.0 == progress[-1]
+    assert {rclpy, gz_sim} == {i.repo for i in cache.most_recent_issues(100)}
+    assert 10 == len(cache.most_recent_issues(100))
+    # Only gz-sim was crawled, and rclcpp isn't polled anymore
+    assert all("rclpy" not in c for c in github.calls)
+    assert rclcpp not in loader._scheduler
+    assert gz_sim in loader._scheduler
+
+
+def test_refresh_watched_by_node_id():
+    repo = Repository(owner="ros2", name="rclpy")
+    repos = {repo: (3, 2)}
+    github = FakeGithub(repos)
+    loader, cache, progress = make_loader(github, repos)
+    loader._load_all_issues()
+    search_interval = loader._scheduler.min_interval
+    github.calls.clear()
+
+    loader.set_watched([node_id(repo, 1), node_id(repo, 4), node_id(repo, 9)])
+    assert loader.WATCHED_MIN_INTERVAL == loader._scheduler.min_interval
+    # Read elsewhere, which doesn't change updatedAt
+    read = make_node(repo, 1)
+    read["isReadByViewer"] = True
+    github.updates = [
+        read,
+        make_node(repo, 4, updated_at="2006-07-05T00:00:00Z", is_pr=True),
+    ]
+    loader._refresh_watched()
+    (call,) = github.calls
+    assert "nodes(ids:" in call
+    issues = {i.number: i for i in cache.most_recent_issues(10)}
+    assert issues[1].is_read
+    assert isoparse("2006-07-05T00:00:00Z") == issues[4].updated_at
+    assert [4] == [i.number for i in cache.most_recent_issues(1)]
+    # The ID that didn't resolve is no longer watched, even if asked again
+    assert (node_id(repo, 1), node_id(repo, 4)) == loader._watched
+    loader.set_watched([node_id(repo, 4), node_id(repo, 9)])
+    assert (node_id(repo, 4),) == loader._watched
+
+    github.calls.clear()
+    loader.set_watched([])
+    assert search_interval == loader._scheduler.min_interval
+    loader._refresh_watched()
+    assert [] == github.calls
+
+
+def test_tick_searches_when_watched_refresh_fails():
+    repo = Repository(owner="ros2", name="rclpy")
+    repos = {repo: (1, 0)}
+    github = FakeGithub(repos)
+    loader, cache, progress = make_loader(github, repos)
+    loader._load_all_issues()
+    loader._schedule_repos(repos)
+    loader._scheduler._next_poll = {repo: 0}
+    loader.set_watched([node_id(repo, 1)])
+
+    def refresh_fails():
+        raise RuntimeError("Watched refresh failed")
+
+    loader._refresh_watched = refresh_fails
+    github.calls.clear()
+    loader._tick()
+    assert any("search(" in c for c in github.calls)
+    assert [] == loader._scheduler.due()
+
+
+def test_failed_crawl_finishes_and_is_retried():
+    repo = Repository(owner="ros2", name="rclpy")
+    repos = {repo: (3, 2)}
+    # Every attempt of the batch, and of each half of it, fails
+    github = FakeGithub(repos, flaky_calls=10)
+    loader, cache, progress = make_loader(github, repos)
+    loader._crawl(progress.append)
+    assert 1.0 == progress[-1]
+    assert [repo] == loader._failed_repos
+    assert not cache.most_recent_issues(10)
+
+    # Not retried until it's time to
+    loader._retry_crawl()
+    assert [repo] == loader._failed_repos
+    loader._next_crawl_retry = 0
+    loader._retry_crawl()
+    assert not loader._failed_repos
+    assert 5 == len(cache.most_recent_issues(10))
+
+
+def test_crawl_reports_progress_when_it_raises(monkeypatch):
+    repos = {Repository(owner="ros2", name="rclpy"): (3, 2)}
+    loader, cache, progress = make_loader(FakeGithub(repos), repos)
+
+    def fail(progress_callback):
+        raise RuntimeError("Crawl failed")
+
+    monkeypatch.setattr(loader, "_load_all_issues", fail)
+    loader._crawl(progress.append)
+    assert [1.0] == progress
+
+
+def test_update_due_repos_backs_off_failed_search():
+    repo = Repository(owner="ros2", name="rclpy")
+    repos = {repo: (1, 0)}
+    github = FakeGithub(repos)
+    loader, cache, progress = make_loader(github, repos)
+    loader._load_all_issues()
+    loader._schedule_repos(repos)
+    loader._scheduler._next_poll = {repo: 0}
+    github.flaky_calls = 1
+    loader._update_due_repos()
+    assert [] == loader._scheduler.due()
+
+
+def test_schedule_counts_dismissed_updates():
+    repo = Repository(owner="ros2", name="rclpy")
+    loader, cache, progress = make_loader(FakeGithub({repo: (0, 0)}), [repo])
+    now = datetime.now(timezone.utc)
+    for number in range(10):
+        issue = _make_issue(make_node(repo, number, updated_at=now.isoformat()))
+        cache.insert(issue)
+        cache.dismiss(issue)
+    loader._schedule_repos([repo])
+    rate = 10 / loader.RATE_WINDOW.total_seconds()
+    assert rate == loader._scheduler._rates[repo]
@@ -0,0 +1,87 @@
+import os
+import threading
+
+from dateutil.parser import isoparse
+
+from treadi import client
+from treadi.data import Issue
+from treadi.data import Repository
+from treadi.data import issue_from_record
+from treadi.loader_process import BatchSender
+from treadi.loader_process import Channel
+from treadi.loader_process import _serve
+
+from .fake_github import FakeGithub
+
+
+def make_channel():
+    r, w = os.pipe()
+    return Channel(os.fdopen(r, "rb"), os.fdopen(w, "wb"))
+
+
+def make_issue(number):
+    return Issue(
+        repo=Repository(owner="ros2", name="rclpy"),
+        created_at=isoparse("2006-07-04T15:00:00Z"),
+        updated_at=isoparse("2006-07-04T16:00:00Z"),
+        number=number,
+    )
+
+
+def test_channel():
+    channel = make_channel()
+    channel.send(("progress", 0.5))
+    channel.send(("dismiss", ("ros2", "rclpy", 1234)))
+    assert ("progress", 0.5) == channel.recv()
+    assert ("dismiss", ("ros2", "rclpy", 1234)) == channel.recv()
+
+
+def test_batch_sender():
+    channel = make_channel()
+    sender = BatchSender(channel, batch_size=3, max_delay=3600)
+    sender.add([make_issue(1), make_issue(2)])
+    sender.add([make_issue(3), make_issue(4)])
+    kind, records = channel.recv()
+    assert "issues" == kind
+    assert [1, 2, 3, 4] == [issue_from_record(r).number for r in records]
+    # Progress flushes any waiting issues first
+    sender.add([make_issue(5)])
+    sender.progress(1.0)
+    assert [5] == [issue_from_record(r).number for r in channel.recv()[1]]
+    assert ("progress", 1.0) == channel.recv()
+
+
+def recv_until(channel, kind):
+    while True:
+        message = channel.recv()
+        if message[0] == kind:
+            return message
+
+
+def test_worker_keeps_serving_after_dismiss(tmp_path, monkeypatch):
+    repo = Repository(owner="ros2", name="rclpy")
+    github = FakeGithub({repo: (3, 1)})
+    monkeypatch.setattr(client, "make_gql_client", lambda access_token: github)
+    repos_file = tmp_path / "repos.txt"
+    repos_file.write_text("ros2/rclpy\n")
+
+    to_worker = make_channel()
+    from_worker = make_channel()
+
+    def serve():
+        try:
+            _serve(Channel(to_worker._reader, from_worker._writer))
+        finally:
+            # A worker that stopped makes recv() raise instead of waiting
+            from_worker._writer.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    to_worker.send(("start", "token", [("file", str(repos_file))]))
+    while recv_until(from_worker, "progress")[1] < 1.0:
+        pass
+
+    # The worker's cache tells the parent about every dismissal
+    for number in (1, 2):
+        to_worker.send(("dismiss", ("ros2", "rclpy", number)))
+        _, records = recv_until(from_worker, "issues")
+        assert [number] == [issue_from_record(r).number for r in records]
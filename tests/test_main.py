@@ -0,0 +1,51 @@
+import os
+import types
+
+import pytest
+
+# Keep Kivy from parsing pytest's arguments
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+
+try:
+    from treadi import main
+except Exception:
+    pytest.skip("Kivy can't open a window here", allow_module_level=True)
+
+from kivy.lang import Builder
+
+from treadi.issue_cache import IssueCache
+
+from .random_issues import rand_issue
+
+
+@pytest.fixture
+def app(monkeypatch):
+    Builder.load_file(os.path.join(os.path.dirname(main.__file__), "treadi.kv"))
+    cache = IssueCache()
+    app = types.SimpleNamespace(
+        issue_cache=cache, issue_loader=None, dismiss_issue=cache.dismiss
+    )
+    monkeypatch.setattr(main.App, "get_running_app", lambda: app)
+    yield app
+    Builder.unload_file(os.path.join(os.path.dirname(main.__file__), "treadi.kv"))
+
+
+def test_recycled_list_dismiss_shows_next_issue(app):
+    issues = [rand_issue(updated_at=f"2006-07-04T{h:02}:00:00Z") for h in range(5)]
+    app.issue_cache.insert_many(issues)
+    screen = main.IssueListScreen(page_size=3)
+    screen._update_issues()
+    assert issues[:1:-1] == [d["issue"] for d in screen.ids.rv.data]
+
+    screen.dismiss(types.SimpleNamespace(issue=issues[3]))
+    assert [issues[4], issues[2], issues[1]] == [d["issue"] for d in screen.ids.rv.data]
+
+
+def test_dismissed_card_labels_are_not_cached(app):
+    issue = rand_issue(updated_at="2006-07-04T15:00:00Z")
+    widget = main.IssueWidget(issue, dismiss_callback=lambda w: None)
+    labels = [w for w in widget.walk() if isinstance(w, main.CachedLabel)]
+    assert 3 == len(labels)
+    assert all(label.cache_key is not None for label in labels)
+    widget.do_dismiss_callback()
+    assert all(label.cache_key is None for label in labels)
@@ -0,0 +1,100 @@
+import pytest
+import requests
+
+from treadi.issue_cache import IssueCache
+from treadi.notifications import NotificationPoller
+from treadi.notifications import read_states_from_notifications
+
+
+def make_notification(full_name, kind, url, unread):
+    return {
+        "repository": {"full_name": full_name},
+        "subject": {"type": kind, "url": url},
+        "unread": unread,
+    }
+
+
+def test_read_states_from_notifications():
+    notifications = [
+        make_notification(
+            "ros2/rclpy",
+            "Issue",
+            "https://api.github.com/repos/ros2/rclpy/issues/1234",
+            False,
+        ),
+        make_notification(
+            "ros2/rclcpp",
+            "PullRequest",
+            "https://api.github.com/repos/ros2/rclcpp/pulls/42",
+            True,
+        ),
+        make_notification(
+            "ros2/rclcpp",
+            "Release",
+            "https://api.github.com/repos/ros2/rclcpp/releases/1",
+            True,
+        ),
+        make_notification("ros2/rclcpp", "Discussion", None, True),
+    ]
+    assert {
+        ("ros2", "rclpy", 1234): True,
+        ("ros2", "rclcpp", 42): False,
+    } == read_states_from_notifications(notifications)
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, json=(), next_url=None):
+        self.status_code = status_code
+        self.headers = {"Last-Modified": "Tue, 04 Jul 2006 15:00:00 GMT"}
+        self.links = {"next": {"url": next_url}} if next_url else {}
+        self._json = list(json)
+
+    def json(self):
+        return list(self._json)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error")
+
+
+class FakeSession:
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return self.responses.pop(0)
+
+
+def test_poll_follows_pages():
+    url = "https://api.github.com/repos/ros2/rclpy/issues/{}"
+    poller = NotificationPoller("token", IssueCache())
+    poller._session = FakeSession(
+        [
+            FakeResponse(
+                200,
+                [make_notification("ros2/rclpy", "Issue", url.format(1), False)],
+                next_url="https://api.github.com/notifications?page=2",
+            ),
+            FakeResponse(
+                200, [make_notification("ros2/rclpy", "Issue", url.format(2), False)]
+            ),
+        ]
+    )
+    changes = []
+    poller._cache.set_read_states = lambda states: changes.append(states) or 0
+    assert poller.poll()
+    assert poller._session.urls[1].endswith("page=2")
+    assert [{("ros2", "rclpy", 1): True, ("ros2", "rclpy", 2): True}] == changes
+    assert poller._last_modified is not None
+
+
+def test_poll_failure_raises():
+    poller = NotificationPoller("token", IssueCache())
+    poller._session = FakeSession([FakeResponse(502)])
+    with pytest.raises(requests.HTTPError):
+        poller.poll()
+    assert poller._last_modified is None
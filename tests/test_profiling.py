@@ -0,0 +1,43 @@
+import threading
+
+from treadi import profiling
+
+
+def test_section_samples_and_times(tmp_path, monkeypatch):
+    profiler = profiling.Profiler(tmp_path)
+    monkeypatch.setattr(profiling, "_observers", (profiler,))
+
+    entered = threading.Event()
+    release = threading.Event()
+
+    def work():
+        with profiling.section("execute"):
+            entered.set()
+            release.wait()
+
+    thread = threading.Thread(target=work, name="Worker 1")
+    thread.start()
+    entered.wait()
+    profiler.sample()
+    release.set()
+    thread.join()
+    profiler.write()
+
+    (folded,) = tmp_path.glob("treadi-*-Worker_1.folded")
+    stack, count = folded.read_text().splitlines()[0].rsplit(" ", 1)
+    assert count == "1"
+    frames = stack.split(";")
+    assert frames[0] == "[execute]"
+    assert any(".work (test_profiling.py:" in f for f in frames)
+
+    (sections,) = tmp_path.glob("treadi-*-sections.txt")
+    text = sections.read_text()
+    assert "Worker 1\n" in text
+    assert "execute:" in text and "in 1 calls" in text
+
+
+def test_section_without_profiler(monkeypatch):
+    monkeypatch.setattr(profiling, "_profiler", None)
+    monkeypatch.setattr(profiling, "_observers", ())
+    with profiling.section("decode"):
+        pass
@@ -0,0 +1,66 @@
+from treadi.refresh_scheduler import RefreshScheduler
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.time = 1000.0
+
+    def __call__(self):
+        return self.time
+
+
+def test_busy_repos_polled_more_often():
+    clock = FakeClock()
+    scheduler = RefreshScheduler(min_interval=15, max_interval=900, now=clock)
+    scheduler.add("busy")
+    scheduler.add("quiet", rate=0)
+    assert [] == scheduler.due()
+    clock.time += 15
+    assert ["busy"] == scheduler.due()
+    scheduler.polled("busy", 5)
+    clock.time += 885
+    assert {"busy", "quiet"} == set(scheduler.due())
+
+
+def test_interval_adapts_to_update_rate():
+    clock = FakeClock()
+    scheduler = RefreshScheduler(min_interval=15, max_interval=900, now=clock)
+    scheduler.add("repo")
+    # Quiet polls make the repo be polled less often
+    intervals = []
+    for _ in range(20):
+        clock.time += scheduler.interval("repo")
+        scheduler.polled("repo", 0)
+        intervals.append(scheduler.interval("repo"))
+    assert intervals == sorted(intervals)
+    assert 900 == intervals[-1]
+    # A burst of activity makes it busy again
+    clock.time += scheduler.interval("repo")
+    scheduler.polled("repo", 100)
+    assert 60 > scheduler.interval("repo")
+
+
+def test_remove():
+    clock = FakeClock()
+    scheduler = RefreshScheduler(now=clock)
+    scheduler.add("repo")
+    scheduler.remove("repo")
+    clock.time += 10000
+    assert [] == scheduler.due()
+
+
+def test_failed_polls_back_off():
+    clock = FakeClock()
+    scheduler = RefreshScheduler(min_interval=15, max_interval=100, now=clock)
+    scheduler.add("repo")
+    waits = []
+    for _ in range(5):
+        clock.time += 1000
+        scheduler.failed("repo")
+        waits.append(scheduler._next_poll["repo"] - clock.time)
+    assert [15, 30, 60, 100, 100] == waits
+    # A successful poll goes back to the usual interval
+    scheduler.polled("repo", 100)
+    scheduler.failed("repo")
+    assert 15 == scheduler._next_poll["repo"] - clock.time
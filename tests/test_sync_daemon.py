@@ -0,0 +1,155 @@
+import os
+import socket
+import stat
+import threading
+import time
+
+import pytest
+
+from treadi.data import Repository
+from treadi.issue_cache import IssueCache
+from treadi.sync_daemon import SyncClient
+from treadi.sync_daemon import SyncDaemon
+from treadi.sync_daemon import default_socket_path
+
+from .fake_github import FakeGithub
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def connect(path, repos_file):
+    cache = IssueCache()
+    progress = []
+    client = SyncClient("token", [("file", str(repos_file))], cache, progress.append)
+    client._path = str(path)
+    client.start()
+    wait_for(lambda: progress and progress[-1] == 1.0)
+    return client, cache
+
+
+def start_daemon(github, path):
+    daemon = SyncDaemon(make_gql_client=lambda access_token: github)
+    thread = threading.Thread(target=daemon.serve, args=(str(path),), daemon=True)
+    thread.start()
+    wait_for(path.exists)
+    return daemon, thread
+
+
+def test_overlapping_repos_loaded_once(tmp_path):
+    rclpy = Repository(owner="ros2", name="rclpy")
+    rclcpp = Repository(owner="ros2", name="rclcpp")
+    gz_sim = Repository(owner="gazebosim", name="gz-sim")
+    github = FakeGithub({rclpy: (3, 1), rclcpp: (2, 0), gz_sim: (4, 2)})
+    path = tmp_path / "sync.sock"
+    daemon, _ = start_daemon(github, path)
+
+    ros_file = tmp_path / "ros.txt"
+    ros_file.write_text("ros2/rclpy\nros2/rclcpp\n")
+    mixed_file = tmp_path / "mixed.txt"
+    mixed_file.write_text("ros2/rclpy\ngazebosim/gz-sim\n")
+
+    ros_client, ros_cache = connect(path, ros_file)
+    mixed_client, mixed_cache = connect(path, mixed_file)
+
+    wait_for(lambda: len(ros_cache.most_recent_issues(100)) == 6)
+    wait_for(lambda: len(mixed_cache.most_recent_issues(100)) == 10)
+    assert {rclpy, rclcpp} == {i.repo for i in ros_cache.most_recent_issues(100)}
+    assert {rclpy, gz_sim} == {i.repo for i in mixed_cache.most_recent_issues(100)}
+    # rclpy was only crawled for the first client
+    crawls = [c for c in github.calls if "(first" in c]
+    assert 1 == sum('name: "rclpy"' in c for c in crawls)
+
+    # Dismissals reach the daemon's cache
+    issue = mixed_cache.most_recent_issues(1, repo=rclpy)[0]
+    mixed_cache.dismiss(issue)
+    mixed_client.dismiss(issue)
+    wait_for(
+        lambda: issue not in daemon._cache.most_recent_issues(100, repo=issue.repo)
+    )
+
+    # Switching repos reuses what the daemon already crawled
+    progress = []
+    mixed_client.set_specs([("file", str(ros_file))], progress.append)
+    # Issues of the old repos are dropped right away
+    assert gz_sim not in {i.repo for i in mixed_cache.most_recent_issues(100)}
+    wait_for(lambda: progress and progress[-1] == 1.0)
+    wait_for(lambda: len(mixed_cache.most_recent_issues(100)) == 5)
+    assert {rclpy, rclcpp} == {i.repo for i in mixed_cache.most_recent_issues(100)}
+    assert issue not in mixed_cache.most_recent_issues(100)
+    crawls = [c for c in github.calls if "(first" in c]
+    assert 1 == sum('name: "rclcpp"' in c for c in crawls)
+    # Nobody wants gz-sim anymore, so it stops being polled
+    wait_for(lambda: gz_sim not in daemon._loader._scheduler)
+    assert rclpy in daemon._loader._scheduler
+
+    # Repos of instances that disconnect stop being polled too
+    ros_client._socket.shutdown(socket.SHUT_RDWR)
+    mixed_client._socket.shutdown(socket.SHUT_RDWR)
+    wait_for(lambda: rclpy not in daemon._loader._scheduler)
+
+
+def test_connection_survives_dismiss(tmp_path):
+    rclpy = Repository(owner="ros2", name="rclpy")
+    github = FakeGithub({rclpy: (3, 1)})
+    path = tmp_path / "sync.sock"
+    start_daemon(github, path)
+    repos_file = tmp_path / "repos.txt"
+    repos_file.write_text("ros2/rclpy\n")
+    client, cache = connect(path, repos_file)
+    wait_for(lambda: len(cache.most_recent_issues(100)) == 4)
+
+    issue = cache.most_recent_issues(1)[0]
+    cache.dismiss(issue)
+    client.dismiss(issue)
+    # The daemon still answers on the same connection
+    progress = []
+    client.set_specs([("file", str(repos_file))], progress.append)
+    wait_for(lambda: progress and progress[-1] == 1.0)
+
+
+def test_dismissals_reach_every_instance(tmp_path):
+    rclpy = Repository(owner="ros2", name="rclpy")
+    github = FakeGithub({rclpy: (3, 1)})
+    path = tmp_path / "sync.sock"
+    start_daemon(github, path)
+    repos_file = tmp_path / "repos.txt"
+    repos_file.write_text("ros2/rclpy\n")
+    first_client, first_cache = connect(path, repos_file)
+    second_client, second_cache = connect(path, repos_file)
+    wait_for(lambda: len(second_cache.most_recent_issues(100)) == 4)
+
+    issue = first_cache.most_recent_issues(1)[0]
+    first_cache.dismiss(issue)
+    first_client.dismiss(issue)
+    wait_for(lambda: issue not in second_cache.most_recent_issues(100))
+    # An instance that connects later doesn't see it either
+    _, later_cache = connect(path, repos_file)
+    wait_for(lambda: len(later_cache.most_recent_issues(100)) == 3)
+    assert issue not in later_cache.most_recent_issues(100)
+
+
+def test_second_daemon_leaves_socket_alone(tmp_path):
+    github = FakeGithub({})
+    path = tmp_path / "sync.sock"
+    start_daemon(github, path)
+    _, second = start_daemon(github, path)
+    second.join(timeout=5)
+    assert not second.is_alive()
+    assert path.exists()
+    assert 0o600 == stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_default_socket_path_is_private(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    path = default_socket_path()
+    directory = os.path.dirname(path)
+    assert 0o700 == stat.S_IMODE(os.stat(directory).st_mode)
+
+    os.chmod(directory, 0o755)
+    with pytest.raises(RuntimeError):
+        default_socket_path()
@@ -0,0 +1,22 @@
+from treadi.texture_cache import TextureCache
+
+
+def test_texture_cache_lru():
+    cache = TextureCache(capacity=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert 1 == cache.get("a")
+    # "b" is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert 1 == cache.get("a")
+    assert 3 == cache.get("c")
+    assert 2 == len(cache)
+    assert (3, 1) == (cache.hits, cache.misses)
+
+
+def test_texture_cache_disabled():
+    cache = TextureCache(capacity=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert 0 == len(cache)
@@ -0,0 +1,48 @@
+from treadi.title_index import TitleIndex
+from treadi.title_index import tokenize
+
+
+def matches(index, query):
+    return [m.keys() for m in index.match(query)]
+
+
+def test_tokenize():
+    assert ["fix", "rclpy", "crash", "on_shutdown"] == tokenize(
+        "Fix rclpy crash: on_shutdown!"
+    )
+
+
+def test_match_tiers():
+    index = TitleIndex()
+    index.add(1, "Fix the build")
+    index.add(2, "Fixing the builder")
+    index.add(3, "Prefix buildfarm")
+    index.add(4, "Unrelated")
+    assert [{1}, {2}, {3}] == matches(index, "fix build")
+    assert [set(), {2}, set()] == matches(index, "fixi")
+    assert [set(), set(), {3}] == matches(index, "refi")
+
+
+def test_remove():
+    index = TitleIndex()
+    index.add(1, "Fix the build")
+    index.add(2, "Fix the tests")
+    index.remove(1)
+    assert [{2}, set(), set()] == matches(index, "fix")
+    assert [set(), set(), set()] == matches(index, "build")
+    # Re-adding a key replaces its title
+    index.add(2, "Flaky tests")
+    assert [set(), set(), set()] == matches(index, "fix")
+    assert 1 == len(index)
+
+
+def test_short_terms_match_title_tokens():
+    index = TitleIndex()
+    for i in range(100):
+        index.add(i, f"s{i} t{i}")
+    index.add("hit", "Segfault in timers")
+    prefix = index.match("s t")[1]
+    assert "hit" in prefix
+    assert 5 in prefix
+    assert "missing" not in prefix
+    assert 101 == len(prefix.keys())